@@ -1,15 +1,26 @@
 import argparse
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
 import datetime
+import fcntl
+import functools
 import hashlib
 import io
 import json
 import logging
 import os
+import posixpath
+import random
 import re
 import shutil
+import stat
 import sys
 import tarfile
-import urllib.request
+import tempfile
+import threading
+import time
 from pathlib import Path
 
 import requests
@@ -31,14 +42,63 @@ Usage:
 
 Commands:
     pack                Pack a staged payload into a FreeBSD package.
+    pack-batch          Pack many staged payloads concurrently.
     redistribute-pkg    Redistribute package.
+    redistribute-all    Redistribute every redistribute spec concurrently.
 
 Examples:
     pkg-tool pack ./config.yml --abi 15 --arch amd64
     pkg-tool redistribute-pkg ./config.yml --abi 14 --arch amd64
+    pkg-tool --profile profile.json assemble-repo ./artifacts ./config.yml --owner o --repo r
 """
 
-def _create_manifest(config_path, abi, arch, payload_dir, output_dir='.', spec=None):
+# Phase records of the running command while profiling (--profile or
+# PKG_TOOL_PROFILE); None when profiling is off.
+profile_phases = None
+
+@contextlib.contextmanager
+def _phase(name):
+    """
+    Time one phase of a command for the profile report.
+
+    Yields a counters dict the phase fills in (bytes_in, bytes_out, files).
+    Wall time comes from perf_counter and CPU time from process_time, so
+    worker threads (hashing, zstd) are included in the CPU figure. For the
+    same reason phases running concurrently in threads (check-updates' HTTP
+    lookups) each count all the CPU time spent while they overlap, so their
+    cpu_s is not additive. Without profiling enabled, nothing is recorded.
+    """
+    counters = {'bytes_in': 0, 'bytes_out': 0, 'files': 0}
+    if profile_phases is None:
+        yield counters
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield counters
+    finally:
+        wall = time.perf_counter() - wall
+        profile_phases.append({
+            'phase': name,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(time.process_time() - cpu, 6),
+            **counters,
+            'mib_per_s': round(max(counters['bytes_in'], counters['bytes_out']) / 2**20 / wall, 3) if wall else None,
+        })
+
+def _write_profile(path, command, phases, wall, cpu):
+    """Write the JSON profile report: the command's totals plus one record per phase, in run order."""
+    report = {
+        'command': command,
+        'wall_s': round(wall, 6),
+        'cpu_s': round(cpu, 6),
+        'phase_cpu_s': 'process-wide; concurrent phases overlap, so their cpu_s is not additive',
+        'phases': phases,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+def _create_manifest(config_path, abi, arch, payload_dir, output_dir='.', spec=None, index=None):
     """
     Create manifest files from a staged payload.
 
@@ -49,52 +109,68 @@ def _create_manifest(config_path, abi, arch, payload_dir, output_dir='.', spec=N
         payload_dir (str): Directory containing the staged payload.
         output_dir (str): Directory to output the manifest files. Defaults to the current directory.
         spec (dict): Pre-validated spec; re-read from config_path when omitted.
+        index (tuple): Payload index from _scan_payload; scanned from payload_dir when omitted.
     """
-    if not os.path.isdir(payload_dir):
-        raise FileNotFoundError(f"Payload directory not found: {payload_dir}")
     if spec is None:
         with open(config_path, "r") as f:
             spec = yaml.safe_load(f)
+    if index is None:
+        if not os.path.isdir(payload_dir):
+            raise FileNotFoundError(f"Payload directory not found: {payload_dir}")
+        index = _scan_payload(payload_dir)
     pkg_config = spec
     manifest = pkg_config["pkg_manifest"]
     manifest['version'] = str(manifest['version'])
     manifest['abi'] = f'FreeBSD:{abi}:{arch}'
     manifest['arch'] = manifest['abi'].lower().replace('amd64', 'x86:64')
-    manifest['flatsize'] = _folder_size(payload_dir)
+    manifest['flatsize'] = sum(entry.stat.st_size for entry in index if entry.link is None)
+    manifest.pop('files', None)  # the payload index is the only source of the files map
 
-    manifest['files'] = {}
-    for root, _, files in os.walk(payload_dir):
-        for file in sorted(files):
-            file_path = os.path.join(root, file)
-            manifest['files'][f'{os.sep}{os.path.relpath(file_path, payload_dir)}'] = _sha256sum(file_path)
+    _write_manifest(os.path.join(output_dir, '+MANIFEST'), manifest, index)
 
-    with open(os.path.join(output_dir, '+MANIFEST'), "w") as f:
-        json.dump(manifest, f, separators=(',', ':'))
+    compact = {key: value for key, value in manifest.items() if key != 'scripts'}
+    with open(os.path.join(output_dir, '+COMPACT_MANIFEST'), "w") as f:
+        json.dump(compact, f, separators=(',', ':'))
 
-    manifest.pop('files', None)
-    manifest.pop('scripts', None)
+def _write_manifest(path, manifest, index):
+    """
+    Write +MANIFEST, streaming the files map straight from the payload index.
 
-    with open(os.path.join(output_dir, '+COMPACT_MANIFEST'), "w") as f:
-        json.dump(manifest, f, separators=(',', ':'))
+    The bytes are identical to json.dump of the manifest with a trailing
+    'files' mapping (compact separators), but the mapping is never built:
+    entries are encoded one at a time into the buffered output file, so
+    memory stays flat however many files the payload holds.
 
-def _create_packagesite_info(compact_manifest_path, output_dir='.'):
+    Args:
+        path (str): Output path of the +MANIFEST file.
+        manifest (dict): Manifest fields without 'files'.
+        index (tuple): Payload index providing the files map, in order.
+    """
+    head = json.dumps(manifest, separators=(',', ':'))
+    with open(path, "w") as f:
+        f.write(head[:-1])
+        f.write(',"files":{' if manifest else '"files":{')
+        separator = ''
+        for entry in index:
+            f.write(f'{separator}{json.dumps(entry.arcname)}:{json.dumps(entry.digest)}')
+            separator = ','
+        f.write('}}')
+
+def _create_packagesite_info(compact_manifest_path, output_dir='.', digest=None):
     """
     Create package site information file.
 
     Args:
         compact_manifest_path (str): Path to the +COMPACT_MANIFEST file.
         output_dir (str): Directory to output the packagesite info file. Defaults to the current directory.
+        digest (tuple): (sha256, size) of the .pkg as recorded while writing it;
+            the package is re-read to compute them when omitted.
     """
     with open(compact_manifest_path, "r") as f:
         pkg_info = json.load(f)
 
     pkg = _pkg_filename(pkg_info['name'], pkg_info['version'])
-    pkg_path = os.path.join(output_dir, pkg)
-
-    pkg_info['path'] = f'All/{pkg}'
-    pkg_info['repopath'] = f'All/{pkg}'
-    pkg_info['sum'] = f'{_sha256sum(pkg_path)}'
-    pkg_info['pkgsize'] = os.path.getsize(pkg_path)
+    pkg_info = _add_site_fields(pkg_info, os.path.join(output_dir, pkg), digest)
 
     with open(os.path.join(output_dir, 'packagesite_info.json'), "w") as f:
         json.dump(pkg_info, f, separators=(',', ':'))
@@ -102,6 +178,31 @@ def _create_packagesite_info(compact_manifest_path, output_dir='.'):
 def _pkg_filename(name, version):
     return f'{name}-{version}.pkg'
 
+# pkg's libzstd decodes windows up to 2^27 (128 MiB) without raising its
+# window limit; long-distance matching is clamped to that so stock pkg can
+# always decompress what we write.
+ZSTD_MAX_WINDOW_LOG = 27
+
+def _validate_compression(compression, source, key):
+    """Validate a zstd compression mapping (level/threads/long), raising with key-path errors."""
+    if not isinstance(compression, dict):
+        raise TypeError(f"{source}: {key} is not a mapping")
+    for setting in compression:
+        if setting not in ('level', 'threads', 'long'):
+            raise ValueError(f"{source}: {key}.{setting}: unknown compression setting")
+    level = compression.get('level')
+    if level is not None and (isinstance(level, bool) or not isinstance(level, int)):
+        raise TypeError(f"{source}: {key}.level must be an integer")
+    if level is not None and not 1 <= level <= zstd.MAX_COMPRESSION_LEVEL:
+        raise ValueError(f"{source}: {key}.level must be between 1 and {zstd.MAX_COMPRESSION_LEVEL}")
+    threads = compression.get('threads')
+    if threads is not None and (isinstance(threads, bool) or not isinstance(threads, int)):
+        raise TypeError(f"{source}: {key}.threads must be an integer")
+    if threads is not None and threads < -1:
+        raise ValueError(f"{source}: {key}.threads must be -1 (all CPUs), 0 (single-threaded) or a thread count")
+    if compression.get('long') is not None and not isinstance(compression['long'], bool):
+        raise TypeError(f"{source}: {key}.long must be a boolean")
+
 def _validate_spec(spec, source):
     """Validate a package spec, raising (ValueError|TypeError) with key-path errors."""
     if not isinstance(spec, dict):
@@ -140,6 +241,32 @@ def _validate_spec(spec, source):
         raise TypeError(f"{source}: build_config is not a mapping")
     if not isinstance(build_config.get('include'), dict):
         raise TypeError(f"{source}: build_config.include must be a mapping")
+    if build_config.get('compression') is not None:
+        _validate_compression(build_config['compression'], source, 'build_config.compression')
+    payload = spec.get('payload')
+    if payload is not None:
+        if pkg_manifest is None:
+            raise ValueError(f"{source}: payload requires pkg_manifest")
+        if not isinstance(payload, list) or not payload:
+            raise TypeError(f"{source}: payload must be a non-empty list")
+        for i, item in enumerate(payload):
+            if not isinstance(item, dict):
+                raise TypeError(f"{source}: payload[{i}] is not a mapping")
+            unknown = sorted(set(item) - {'src', 'dest', 'mode'})
+            if unknown:
+                raise ValueError(f"{source}: payload[{i}].{unknown[0]}: unknown key")
+            for key in ('src', 'dest'):
+                if not item.get(key) or not isinstance(item[key], str):
+                    raise TypeError(f"{source}: payload[{i}].{key} must be a non-empty string")
+            if '..' in item['dest'].split('/'):
+                raise ValueError(f"{source}: payload[{i}].dest must stay inside the package")
+            if 'mode' in item:
+                try:
+                    _payload_mode(item['mode'])
+                except ValueError as e:
+                    raise ValueError(f"{source}: payload[{i}].{e}") from None
+                except TypeError as e:
+                    raise TypeError(f"{source}: payload[{i}].{e}") from None
     content = spec.get('content')
     if content is not None:
         if not isinstance(content, dict):
@@ -188,6 +315,17 @@ def _validate_repo_config(config, source):
     pkg_repo = config.get('pkg-repo')
     if not isinstance(pkg_repo, dict) or not pkg_repo.get('abi') or not pkg_repo.get('arch'):
         raise TypeError(f"{source}: pkg-repo.abi and pkg-repo.arch are required")
+    if pkg_repo.get('compression') is not None:
+        _validate_compression(pkg_repo['compression'], source, 'pkg-repo.compression')
+    meta_conf = config.get('meta-conf', {})
+    if not isinstance(meta_conf, dict):
+        raise TypeError(f"{source}: meta-conf is not a mapping")
+    for key in ('data', 'data_archive'):
+        value = meta_conf.get(key)
+        if value is not None and (not isinstance(value, str) or not value or '/' in value):
+            raise TypeError(f"{source}: meta-conf.{key} must be a plain file name")
+    if 'data_archive' in meta_conf and 'data' not in meta_conf:
+        raise TypeError(f"{source}: meta-conf.data_archive requires meta-conf.data")
 
 def _load_spec(config_path):
     with open(config_path) as f:
@@ -250,6 +388,45 @@ def build_matrix(packages=None, pkgs_dir='pkgs', repo_config='config.yml'):
         'include': includes,
     }
 
+def _compression_settings(configured, override=None):
+    """Merge configured zstd settings with CLI overrides (None means 'not given')."""
+    settings = dict(configured or {})
+    settings.update({k: v for k, v in (override or {}).items() if v is not None})
+    return settings
+
+zstd_compressors = {}
+
+def _zstd_compressor(compression=None):
+    """
+    Build the zstd compressor for packages and packagesites.
+
+    Compressors are memoized per settings, so repeated packs in one process
+    (pack-batch workers) share their contexts. A context must not be used by
+    two threads at once; pkg-tool only compresses from one thread per process.
+
+    Args:
+        compression (dict): level (default 3), threads (0 = single-threaded,
+            -1 = all CPUs) and long (long-distance matching, window clamped to
+            ZSTD_MAX_WINDOW_LOG). Empty or None keeps zstd's defaults.
+
+    Returns:
+        zstd.ZstdCompressor: The configured compressor.
+    """
+    compression = compression or {}
+    key = json.dumps(compression, sort_keys=True)
+    if key in zstd_compressors:
+        return zstd_compressors[key]
+    level = compression.get('level', 3)
+    threads = compression.get('threads', 0)
+    if not compression.get('long'):
+        cctx = zstd.ZstdCompressor(level=level, threads=threads)
+    else:
+        params = zstd.ZstdCompressionParameters.from_level(
+            level, threads=threads, enable_ldm=True, window_log=ZSTD_MAX_WINDOW_LOG)
+        cctx = zstd.ZstdCompressor(compression_params=params)
+    zstd_compressors[key] = cctx
+    return cctx
+
 def _pinned_tarinfo(tar, path, arcname):
     """TarInfo with the reproducible metadata every package member carries."""
     info = tar.gettarinfo(path)
@@ -261,14 +438,264 @@ def _pinned_tarinfo(tar, path, arcname):
     info.mtime = 0
     return info
 
-def assemble_repo(artifacts_dir, repo_config_path, owner, repo, output_dir='pages'):
+PayloadEntry = collections.namedtuple('PayloadEntry', 'path arcname stat link digest mode data',
+                                      defaults=(None, None))
+PayloadEntry.__doc__ = """One payload member: host path, package path, lstat result, symlink target
+(None for files), sha256, permission override (None keeps the stat's) and in-memory content
+for generated members (path is None then) and for small files kept from hashing."""
+
+def _payload_entry(path, arcname):
+    """Unhashed PayloadEntry for one file or symlink on disk."""
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        return PayloadEntry(path, arcname, st, os.readlink(path), None)
+    if not stat.S_ISREG(st.st_mode):
+        raise ValueError(f"{path}: unsupported file type in payload")
+    return PayloadEntry(path, arcname, st, None, None)
+
+def _virtual_entry(arcname, data, mode=0o644):
+    """A generated payload member that only exists in memory (e.g. the plugin version annotation)."""
+    st = os.stat_result((stat.S_IFREG | mode, 0, 0, 1, 0, 0, len(data), 0, 0, 0))
+    return PayloadEntry(None, arcname, st, None, hashlib.sha256(data).hexdigest(), mode, data)
+
+def _index_order(entry):
+    """Sort key reproducing sorted os.walk order: a directory's files, then its subdirectories."""
+    parts = entry.arcname.strip('/').split('/')
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+def _with_members(index, members):
+    """The index with members added (replacing entries of the same name), in walk order."""
+    merged = {entry.arcname: entry for entry in index}
+    merged.update((entry.arcname, entry) for entry in members)
+    return tuple(sorted(merged.values(), key=_index_order))
+
+def _walk_payload(payload_dir, prefix=''):
+    """Unhashed entries for every file under payload_dir, in sorted walk order, packaged under prefix."""
+    index = []
+    for root, dirs, names in os.walk(payload_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            index.append(_payload_entry(path, f"{prefix}/{os.path.relpath(path, payload_dir)}"))
+    return index
+
+def _payload_mode(value):
+    """Permission bits from a spec mode: YAML's octal integer (0755) or an octal string ('0755')."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError("mode must be an octal number")
+    try:
+        mode = int(value, 8) if isinstance(value, str) else value
+    except ValueError:
+        mode = -1
+    if not 0 <= mode <= 0o7777:
+        raise ValueError(f"mode {value!r} is not a permission value")
+    return mode
+
+def _walk_overlay(mapping, base_dir):
+    """
+    Unhashed entries for a spec's declarative payload mapping.
+
+    Each mapping item packs src (a file or a directory tree, relative to
+    base_dir) at dest inside the package, read straight from the source tree
+    instead of being copied into a staging root. Files get item mode
+    (default 0644, the permissions the build scripts normalized to);
+    symlinks keep their own. A later item wins over an earlier one at the
+    same destination, so a narrower item can re-mode a single file.
+
+    Args:
+        mapping (list): Validated payload items (src, dest, optional mode).
+        base_dir (str): Directory src paths are relative to (the spec's dir).
+
+    Returns:
+        list: PayloadEntry per mapped file.
+    """
+    entries = {}
+    for item in mapping:
+        src = os.path.normpath(os.path.join(base_dir, item['src']))
+        dest = '/' + item['dest'].strip('/')
+        mode = _payload_mode(item.get('mode', 0o644))
+        if os.path.isdir(src):
+            mapped = _walk_payload(src, dest)
+        elif os.path.lexists(src):
+            mapped = [_payload_entry(src, dest)]
+        else:
+            raise FileNotFoundError(f"Payload source not found: {src}")
+        for entry in mapped:
+            entries[entry.arcname] = entry if entry.link is not None else entry._replace(mode=mode)
+    return list(entries.values())
+
+# small payload files keep the bytes they were hashed from, so the tarball
+# does not read them again; bounded per pack
+PAYLOAD_INLINE_MAX = 64 << 10
+PAYLOAD_INLINE_BUDGET = 64 << 20
+
+def _hash_member(path, keep):
+    """(sha256, content) of a payload file; content is only kept (else None) when keep is set."""
+    if not keep:
+        return _sha256sum(path), None
+    with open(path, 'rb', buffering=0) as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), data
+
+def _hash_index(index, jobs=None, digest_cache=None):
+    """
+    Fill in the missing digests of an index and freeze it.
+
+    Hashing runs on a bounded thread pool (hashlib releases the GIL);
+    results are collected in index order, so the index — and the +MANIFEST
+    built from it — is identical for any worker count. Entries that already
+    carry a digest (generated members) are left alone. Files of up to
+    PAYLOAD_INLINE_MAX bytes keep the content they were hashed from (up to
+    PAYLOAD_INLINE_BUDGET in total), so _create_pkg reads each of them once;
+    bigger files are read again when archived.
+
+    Args:
+        index (list): PayloadEntry items.
+        jobs (int): Hashing worker threads. Defaults to the CPU count.
+        digest_cache (dict): Digest cache from _load_digest_cache; regular
+            files whose stat key is cached are not re-read, and new digests
+            are added to it.
+
+    Returns:
+        tuple: The entries with their digests.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, got {jobs}")
+    digests = [entry.digest for entry in index]
+    # symlinks hash their target, which their own stat key does not track
+    cacheable = [digest_cache is not None and entry.path is not None and entry.link is None for entry in index]
+    for i, entry in enumerate(index):
+        if digests[i] is None and cacheable[i]:
+            digests[i] = digest_cache.pop(_digest_key(entry.stat), None)
+            if digests[i] is not None:
+                digest_cache[_digest_key(entry.stat)] = digests[i]  # most recently used
+    missing = [i for i, digest in enumerate(digests) if digest is None]
+    keep, budget = [], PAYLOAD_INLINE_BUDGET
+    for i in missing:
+        size = index[i].stat.st_size
+        keep.append(index[i].link is None and size <= PAYLOAD_INLINE_MAX and size <= budget)
+        budget -= size if keep[-1] else 0
+    jobs = min(jobs or os.cpu_count() or 1, len(missing) or 1)
+    if jobs > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            hashed = list(pool.map(_hash_member, (index[i].path for i in missing), keep))
+    else:
+        hashed = [_hash_member(index[i].path, k) for i, k in zip(missing, keep)]
+    contents = [entry.data for entry in index]
+    for i, (digest, data) in zip(missing, hashed):
+        digests[i] = digest
+        if data is not None:
+            contents[i] = data
+        if cacheable[i]:
+            digest_cache[_digest_key(index[i].stat)] = digest
+    return tuple(entry._replace(digest=digest, data=data)
+                 for entry, digest, data in zip(index, digests, contents))
+
+def _scan_payload(payload_dir, jobs=None, digest_cache=None):
+    """
+    Walk the payload once and return its immutable index.
+
+    Every member is lstat'ed and hashed exactly once; the manifest, the
+    flatsize and the package tarball are all derived from the returned
+    entries instead of re-walking the tree. Entries are in sorted walk order,
+    regular files and symlinks alike (directories are implied by their
+    members, as before).
+
+    Args:
+        payload_dir (str): Directory containing the staged payload.
+        jobs (int): Hashing worker threads. Defaults to the CPU count.
+        digest_cache (dict): Digest cache, see _hash_index.
+
+    Returns:
+        tuple: PayloadEntry per payload file.
+    """
+    return _hash_index(_walk_payload(payload_dir), jobs, digest_cache)
+
+def _digest_key(st):
+    """Digest cache key: a file with the same inode, size and timestamps has the same content."""
+    return f'{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{st.st_ctime_ns}'
+
+DIGEST_CACHE_MAX_ENTRIES = 500000
+OUTPUT_CACHE_MAX_BYTES = 4 << 30
+
+def _load_digest_cache(path):
+    """
+    Load the on-disk payload digest cache.
+
+    A missing or unreadable cache is an empty one; stale entries never match
+    because any change to a file moves its mtime/ctime, and they age out of
+    the LRU bound on save.
+
+    Args:
+        path (str): Path to the cache file.
+
+    Returns:
+        dict: {stat key: sha256}, least recently used first.
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.getLogger(__name__).warning(f"ignoring unreadable digest cache {path}: {e}")
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != 1 or not isinstance(cache.get('digests'), dict):
+        return {}
+    return cache['digests']
+
+def _save_digest_cache(path, cache, max_entries=DIGEST_CACHE_MAX_ENTRIES):
+    """
+    Atomically write the digest cache, keeping the max_entries most recently used.
+
+    The write merges with what is on disk under an exclusive lock, so packs
+    running concurrently (pack-batch workers, parallel build scripts) add to
+    the cache instead of overwriting each other; this process's entries count
+    as the most recently used.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = _load_digest_cache(path)
+        for key in cache:
+            merged.pop(key, None)
+        merged.update(cache)
+        entries = list(merged.items())[-max_entries:] if max_entries > 0 else []
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'digests': dict(entries)}, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+digest_caches = {}
+
+def _digest_cache_for(path):
+    """The digest cache for path, loaded once per process and shared by every pack in it."""
+    if path not in digest_caches:
+        digest_caches[path] = _load_digest_cache(path)
+    return digest_caches[path]
+
+def _payload_tarinfo(entry):
+    """TarInfo for a payload entry, built from its recorded lstat (no re-stat)."""
+    info = tarfile.TarInfo(entry.arcname)
+    info.mode = stat.S_IMODE(entry.stat.st_mode) if entry.mode is None else entry.mode
+    if entry.link is None:
+        info.type = tarfile.REGTYPE
+        info.size = entry.stat.st_size
+    else:
+        info.type = tarfile.SYMTYPE
+        info.linkname = entry.link
+    return info
+
+def assemble_repo(artifacts_dir, repo_config_path, owner, repo, output_dir='pages', compression=None,
+                  placement='copy', incremental=False, workers=None, index_json=False):
     """
     Assemble the published repo tree from built packages.
 
     Takes a directory of build outputs (each .pkg next to its
     packagesite_info.json, or a bare .pkg) and produces the complete
     serveable tree: FreeBSD:<abi>:<arch>/latest/... layout, accumulated
-    packagesite.yaml packed into packagesite.tzst + symlink, meta.conf,
+    packagesite.yaml packed into packagesite.tzst + symlink (plus the
+    data.tzst catalogue + symlink when meta-conf has data), meta.conf,
     opnware.conf, robots.txt and index pages. abi/arch come from each
     artifact's own manifest and are validated against the repo config.
 
@@ -278,12 +705,32 @@ def assemble_repo(artifacts_dir, repo_config_path, owner, repo, output_dir='page
         owner (str): GitHub owner, used in the opnware.conf URL.
         repo (str): GitHub repo name, used in the opnware.conf URL.
         output_dir (str): Directory to output the repo tree. Defaults to 'pages'.
+        compression (dict): zstd overrides for the packagesite (level/threads/long);
+            falls back to pkg-repo.compression from the repo config.
+        placement (str): How packages land in the tree: copy (default),
+            hardlink, reflink or symlink, with automatic fallback (see
+            _place_pkg). Arch-independent packages are placed once and their
+            other arch slots reuse that copy.
+        incremental (bool): Update the tree already in output_dir instead of
+            building it from the artifacts alone. Published packages are
+            kept; an artifact replaces the published package of the same
+            name in its slot (the superseded file is removed), so
+            artifacts_dir only needs the new or changed packages. The
+            packagesites, meta.conf files and indexes are regenerated.
+        workers (int): Processes assembling the FreeBSD:<abi>:<arch> slots
+            concurrently. Defaults to the CPU count. The output does not
+            depend on it; failures of all slots are reported together.
+        index_json (bool): Also write a machine-readable index.json next to
+            every index.html.
     """
+    if placement not in PLACEMENTS:
+        raise ValueError(f"unknown placement {placement!r}, expected one of {', '.join(PLACEMENTS)}")
     if not os.path.isdir(artifacts_dir):
         raise FileNotFoundError(f"Artifacts directory not found: {artifacts_dir}")
     repo_config = _load_repo_config(repo_config_path)
     declared_abis = [str(a) for a in repo_config.get('pkg-repo', {}).get('abi', [])]
     declared_archs = [str(a) for a in repo_config.get('pkg-repo', {}).get('arch', [])]
+    compression = _compression_settings(repo_config['pkg-repo'].get('compression'), compression)
 
     pkg_files = []
     for root, dirs, files in os.walk(artifacts_dir):
@@ -291,62 +738,88 @@ def assemble_repo(artifacts_dir, repo_config_path, owner, repo, output_dir='page
         for name in sorted(files):
             if name.endswith('.pkg'):
                 pkg_files.append(os.path.join(root, name))
-    if not pkg_files:
+    if not pkg_files and not incremental:
         raise ValueError(f"No .pkg files found in {artifacts_dir}")
 
     packages_by_dir = {}
-    for pkg_path in pkg_files:
-        sibling = os.path.join(os.path.dirname(pkg_path), 'packagesite_info.json')
-        if os.path.exists(sibling):
-            with open(sibling, "r") as f:
-                info = json.load(f)
-        else:
-            try:
-                info = _read_packagesite_info(pkg_path)
-            except (tarfile.TarError, KeyError, json.JSONDecodeError, zstd.ZstdError, OSError, EOFError) as e:
-                raise ValueError(f"{pkg_path}: could not read package manifest: {e}")
-            info = _add_site_fields(info, pkg_path)
-        abi_field = info.get('abi')
-        if not abi_field:
-            raise ValueError(f"{pkg_path}: no 'abi' in packagesite info")
-        parts = abi_field.split(':')
-        if len(parts) != 3 or parts[0] != 'FreeBSD':
-            raise ValueError(f"{pkg_path}: unexpected abi {abi_field!r}")
-        abi, arch = parts[1], parts[2]
-        if abi not in declared_abis:
-            raise ValueError(
-                f"{pkg_path}: abi {abi} not declared in repo config {repo_config_path} "
-                f"(pkg-repo.abi: {declared_abis})")
-        if arch == '*':
-            # architecture-independent meta-packages (e.g. lang/go) are valid
-            # for every arch the repo declares; land them in each slot
-            archs = declared_archs
-        elif arch not in declared_archs:
-            raise ValueError(
-                f"{pkg_path}: arch {arch} not declared in repo config {repo_config_path} "
-                f"(pkg-repo.arch: {declared_archs})")
-        else:
-            archs = [arch]
-        for slot_arch in archs:
-            packages_by_dir.setdefault(f'FreeBSD:{abi}:{slot_arch}', []).append((pkg_path, info))
-
-    for repo_dir, packages in packages_by_dir.items():
-        latest = os.path.join(output_dir, repo_dir, 'latest')
-        target = os.path.join(latest, 'All')
-        os.makedirs(target, exist_ok=True)
-        with open(os.path.join(latest, 'packagesite.yaml'), 'w') as f:
-            for pkg_path, info in packages:
-                shutil.copy(pkg_path, os.path.join(target, os.path.basename(pkg_path)))
-                f.write(json.dumps(info, separators=(',', ':')) + '\n')
-
-    for entry in sorted(os.listdir(output_dir)):
-        if not entry.startswith('FreeBSD:'):
-            continue
-        latest = os.path.join(output_dir, entry, 'latest')
-        _create_packagesite_tzst(latest)
-        with open(os.path.join(latest, 'meta.conf'), 'w') as f:
-            json.dump(repo_config.get('meta-conf', {}), f, indent=2)
-            f.write('\n')
+    with _phase('read manifests') as counters:
+        counters['files'] = len(pkg_files)
+        for pkg_path in pkg_files:
+            sibling = os.path.join(os.path.dirname(pkg_path), 'packagesite_info.json')
+            if os.path.exists(sibling):
+                with open(sibling, "r") as f:
+                    info = json.load(f)
+            else:
+                try:
+                    info = _read_packagesite_info(pkg_path)
+                except (tarfile.TarError, KeyError, json.JSONDecodeError, zstd.ZstdError, OSError, EOFError) as e:
+                    raise ValueError(f"{pkg_path}: could not read package manifest: {e}")
+                info = _add_site_fields(info, pkg_path)
+            abi_field = info.get('abi')
+            if not abi_field:
+                raise ValueError(f"{pkg_path}: no 'abi' in packagesite info")
+            parts = abi_field.split(':')
+            if len(parts) != 3 or parts[0] != 'FreeBSD':
+                raise ValueError(f"{pkg_path}: unexpected abi {abi_field!r}")
+            abi, arch = parts[1], parts[2]
+            if abi not in declared_abis:
+                raise ValueError(
+                    f"{pkg_path}: abi {abi} not declared in repo config {repo_config_path} "
+                    f"(pkg-repo.abi: {declared_abis})")
+            if arch == '*':
+                # architecture-independent meta-packages (e.g. lang/go) are valid
+                # for every arch the repo declares; land them in each slot
+                archs = declared_archs
+            elif arch not in declared_archs:
+                raise ValueError(
+                    f"{pkg_path}: arch {arch} not declared in repo config {repo_config_path} "
+                    f"(pkg-repo.arch: {declared_archs})")
+            else:
+                archs = [arch]
+            for slot_arch in archs:
+                packages_by_dir.setdefault(f'FreeBSD:{abi}:{slot_arch}', []).append((pkg_path, info))
+
+    published = {}
+    if incremental:
+        with _phase('read published') as counters:
+            published = _published_packages(output_dir)
+            counters['files'] = sum(len(entries) for entries in published.values())
+
+    slots = [*packages_by_dir, *(d for d in published if d not in packages_by_dir)]
+    # an arch-independent package is placed for real in its first slot only;
+    # symlink placement points its other slots there
+    first_copies = {}
+    for repo_dir in slots:
+        for pkg_path, info in packages_by_dir.get(repo_dir, []):
+            first_copies.setdefault(pkg_path, os.path.join(output_dir, repo_dir, 'latest', 'All',
+                                                           os.path.basename(pkg_path)))
+    jobs = [(output_dir, repo_dir, packages_by_dir.get(repo_dir, []), published.get(repo_dir, {}), placement,
+             first_copies, compression, repo_config.get('meta-conf', {}), profile_phases is not None)
+            for repo_dir in slots]
+    workers = min(workers or os.cpu_count() or 1, len(slots))
+    errors = []
+    with _phase('slots') as counters:
+        counters['files'] = len(slots)
+        with contextlib.ExitStack() as stack:
+            if workers > 1:
+                pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+                calls = [pool.submit(_assemble_slot, *job).result for job in jobs]
+            else:
+                calls = [functools.partial(_assemble_slot, *job) for job in jobs]
+            outcomes = []
+            for call in calls:
+                try:
+                    outcomes.append(call())
+                except (concurrent.futures.process.BrokenProcessPool, OSError) as e:
+                    # collected so every failing slot is reported; programming errors propagate
+                    outcomes.append(e)
+    for repo_dir, outcome in zip(slots, outcomes):
+        if isinstance(outcome, Exception):
+            errors.append(f"{repo_dir}: {outcome}")
+        elif profile_phases is not None:
+            profile_phases.extend(dict(record, phase=f"{repo_dir}: {record['phase']}") for record in outcome)
+    if errors:
+        raise ValueError(f"assembling {len(errors)} of {len(slots)} repo slots failed:\n" + '\n'.join(errors))
 
     with open(os.path.join(output_dir, 'opnware.conf'), 'w') as f:
         f.write(f'opnware: {{\n'
@@ -355,42 +828,267 @@ def assemble_repo(artifacts_dir, repo_config_path, owner, repo, output_dir='page
                 f'  enabled: yes\n'
                 f'}}\n')
 
-    _generate_index_tree(output_dir)
     with open(os.path.join(output_dir, 'robots.txt'), 'w') as f:
         f.write('User-agent: *\nDisallow: /\n')
+    # last, so the listings already show every file of this run
+    with _phase('index') as counters:
+        counters['files'] = _generate_index_tree(output_dir, index_json)
+
+PLACEMENTS = ('copy', 'hardlink', 'reflink', 'symlink')
+# Linux _IOW(0x94, 9, int): share the source file's extents (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """
+    Copy src to dst by sharing extents instead of bytes.
+
+    Tries the FICLONE ioctl, then copy_file_range (an in-kernel copy, which
+    filesystems that support it turn into a clone). Raises OSError when the
+    filesystem can do neither, e.g. across filesystems.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            if not hasattr(os, 'copy_file_range'):
+                raise
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if not copied:
+                    raise OSError(f"{src}: copy_file_range stopped short")
+                remaining -= copied
+    shutil.copymode(src, dst)
+
+def _place_pkg(src, dst, placement='copy', first=None):
+    """
+    Put one package into the repo tree with the given placement strategy.
+
+    hardlink falls back to reflink and reflink to a plain copy, e.g. when
+    the artifacts live on another filesystem. symlink only applies to a
+    package that is already in the tree (an arch-independent package's
+    further arch slots get a relative link to its first copy, which may
+    not be written yet); the first copy itself is hardlinked or copied,
+    since the artifacts dir is not published. An existing dst is
+    replaced, never written through, so a rerun cannot modify a
+    hardlinked artifact.
+
+    Args:
+        src (str): Package file in the artifacts dir.
+        dst (str): Target path in the repo tree.
+        placement (str): One of PLACEMENTS.
+        first (str): Where the same package is placed for real in the tree;
+            the symlink target. Other strategies place from src, so slots
+            can be assembled concurrently.
+
+    Returns:
+        str: The strategy actually used.
+    """
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if placement == 'symlink' and first:
+        os.symlink(os.path.relpath(first, os.path.dirname(dst)), dst)
+        return 'symlink'
+    if placement in ('hardlink', 'symlink'):
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    if placement != 'copy':
+        try:
+            _reflink(src, dst)
+            return 'reflink'
+        except OSError:
+            if os.path.lexists(dst):
+                os.unlink(dst)
+    shutil.copy(src, dst)
+    return 'copy'
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def _stream_tar(fobj):
+    """
+    Open a possibly compressed tarball for a single forward pass.
+
+    The compression is sniffed from the leading magic bytes: zstd frames are
+    decoded incrementally through zstandard (tarfile cannot read them), and
+    anything else (xz, gzip, bzip2 or a plain tar) goes to tarfile's own
+    stream detection. Nothing is decompressed beyond what the caller reads.
+
+    Args:
+        fobj: Seekable binary file object positioned at the tarball.
+
+    Returns:
+        tarfile.TarFile: Opened in stream mode; fobj stays owned by the caller.
+    """
+    magic = fobj.read(len(ZSTD_MAGIC))
+    fobj.seek(-len(magic), io.SEEK_CUR)
+    if magic == ZSTD_MAGIC:
+        return tarfile.open(fileobj=zstd.ZstdDecompressor().stream_reader(fobj), mode='r|')
+    return tarfile.open(fileobj=fobj, mode='r|*')
+
+def _assemble_slot(output_dir, repo_dir, packages, kept, placement, first_copies, compression, meta_conf,
+                   profile=False):
+    """
+    Assemble one FreeBSD:<abi>:<arch> slot: place its packages, write and
+    pack its packagesite (and the data catalogue when meta.conf names one)
+    and write its meta.conf.
+
+    Slots share nothing but read-only inputs, so assemble_repo runs them in
+    a process pool. kept holds the slot's published entries (incremental
+    mode); an entry of the same name as a new package is superseded and its
+    file removed.
+
+    Returns:
+        list: The slot's phase records when profile is set (a worker's own
+        records never reach the parent process), else None. The caller's
+        profile is left untouched, in or out of process.
+    """
+    global profile_phases
+    outer, profile_phases = profile_phases, [] if profile else None
+    try:
+        entries = _place_slot(output_dir, repo_dir, packages, kept, placement, first_copies)
+        latest = os.path.join(output_dir, repo_dir, 'latest')
+        with _phase('packagesite') as counters:
+            counters['bytes_in'] = os.path.getsize(os.path.join(latest, 'packagesite.yaml'))
+            _create_packagesite_tzst(latest, compression)
+            counters['bytes_out'] = os.path.getsize(os.path.join(latest, 'packagesite.tzst'))
+            counters['files'] = 1
+            if meta_conf.get('data'):
+                _create_data_tzst(latest, entries, meta_conf, compression)
+                counters['files'] += 1
+            with open(os.path.join(latest, 'meta.conf'), 'w') as f:
+                json.dump(meta_conf, f, indent=2)
+                f.write('\n')
+        return profile_phases
+    finally:
+        profile_phases = outer
+
+def _place_slot(output_dir, repo_dir, packages, kept, placement, first_copies):
+    """Place a slot's packages into its All/ dir and write its packagesite.yaml (kept entries first).
+
+    Returns:
+        list: The slot's packagesite entries, in packagesite order.
+    """
+    latest = os.path.join(output_dir, repo_dir, 'latest')
+    target = os.path.join(latest, 'All')
+    kept = dict(kept)
+    with _phase('copy') as counters:
+        os.makedirs(target, exist_ok=True)
+        lines = []
+        for pkg_path, info in packages:
+            dst = os.path.join(target, os.path.basename(pkg_path))
+            first = first_copies.get(pkg_path)
+            _place_pkg(pkg_path, dst, placement, first if first != dst else None)
+            superseded = kept.pop(info.get('name'), None)
+            if superseded and superseded.get('path') != info.get('path'):
+                _remove_published(latest, superseded)
+            lines.append(info)
+            counters['files'] += 1
+            counters['bytes_out'] += os.path.getsize(pkg_path)
+        entries = [*kept.values(), *lines]
+        with open(os.path.join(latest, 'packagesite.yaml'), 'w') as f:
+            f.writelines(json.dumps(info, separators=(',', ':')) + '\n' for info in entries)
+    return entries
+
+def _read_packagesite(fobj):
+    """Parse the packagesite.yaml lines out of a packagesite archive (any compression _stream_tar reads)."""
+    with _stream_tar(fobj) as tar:
+        for member in tar:
+            if member.name.lstrip('./') == 'packagesite.yaml':
+                return [json.loads(line) for line in tar.extractfile(member).read().decode().splitlines()
+                        if line.strip()]
+    raise KeyError("no packagesite.yaml member")
+
+def _published_packages(output_dir):
+    """
+    Read the packagesites of a published repo tree.
+
+    Returns:
+        dict: {'FreeBSD:<abi>:<arch>': {package name: packagesite entry}} for
+        every slot in output_dir that has a packagesite.tzst.
+    """
+    published = {}
+    if not os.path.isdir(output_dir):
+        return published
+    for entry in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, entry, 'latest', 'packagesite.tzst')
+        if not entry.startswith('FreeBSD:') or not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                published[entry] = {info['name']: info for info in _read_packagesite(f)}
+        except (tarfile.TarError, KeyError, json.JSONDecodeError, zstd.ZstdError, OSError, EOFError) as e:
+            raise ValueError(f"{path}: could not read published packagesite: {e}")
+    return published
+
+def _remove_published(latest_dir, info):
+    """Delete a superseded package file (its packagesite path) from a slot's latest dir."""
+    path = os.path.normpath(os.path.join(latest_dir, info.get('path', '')))
+    if os.path.dirname(path) != os.path.normpath(os.path.join(latest_dir, 'All')):
+        raise ValueError(f"{latest_dir}: published package path {info.get('path')!r} is outside All/")
+    if os.path.lexists(path):
+        os.unlink(path)
 
 def _read_packagesite_info(pkg_path):
-    """Read the +COMPACT_MANIFEST out of a .pkg file."""
-    with open(pkg_path, 'rb') as compressed_file:
-        dctx = zstd.ZstdDecompressor()
-        with dctx.stream_reader(compressed_file) as decompressed_stream:
-            decompressed_data = io.BytesIO(decompressed_stream.read())
-    with tarfile.open(fileobj=decompressed_data, mode='r:') as tar:
-        return json.loads(tar.extractfile('+COMPACT_MANIFEST').read().decode())
-
-def _add_site_fields(info, pkg_path):
-    """Add the packagesite fields derived from the pkg file itself."""
+    """
+    Read the +COMPACT_MANIFEST out of a .pkg file.
+
+    The package is streamed and reading stops at the manifest, which pkg
+    writes as the first member — a multi-hundred-megabyte package costs one
+    block of decompression, not a full in-memory copy. Packages that carry it
+    later are scanned until it turns up. zstd, xz and gzip packages are read.
+    """
+    with open(pkg_path, 'rb') as f, _stream_tar(f) as tar:
+        for member in tar:
+            if member.name.lstrip('./') == '+COMPACT_MANIFEST':
+                return json.loads(tar.extractfile(member).read().decode())
+    raise KeyError(f"{pkg_path}: no +COMPACT_MANIFEST member")
+
+def _add_site_fields(info, pkg_path, digest=None):
+    """Add the packagesite fields derived from the pkg file itself.
+
+    digest is the (sha256, size) pair when the caller already has it from
+    writing the file; otherwise the file is hashed here.
+    """
     pkg_name = os.path.basename(pkg_path)
     info['path'] = f'All/{pkg_name}'
     info['repopath'] = f'All/{pkg_name}'
-    info['sum'] = f'{_sha256sum(pkg_path)}'
-    info['pkgsize'] = os.path.getsize(pkg_path)
+    if digest is None:
+        digest = (_sha256sum(pkg_path), os.path.getsize(pkg_path))
+    info['sum'], info['pkgsize'] = digest
     return info
 
-def _create_packagesite_tzst(latest_dir):
-    """Pack packagesite.yaml into packagesite.tzst, add the symlink, drop the source."""
-    yaml_path = os.path.join(latest_dir, 'packagesite.yaml')
-    tzst_path = os.path.join(latest_dir, 'packagesite.tzst')
-    with open(tzst_path, 'wb') as fobj, zstd.ZstdCompressor().stream_writer(fobj) as zobj, \
+def _create_packagesite_tzst(latest_dir, compression=None, archive='packagesite', member='packagesite.yaml'):
+    """Pack member into <archive>.tzst, add the <archive>.pkg symlink, drop the source."""
+    yaml_path = os.path.join(latest_dir, member)
+    tzst_path = os.path.join(latest_dir, f'{archive}.tzst')
+    with open(tzst_path, 'wb') as fobj, _zstd_compressor(compression).stream_writer(fobj) as zobj, \
             tarfile.open(fileobj=zobj, mode='w|', format=tarfile.PAX_FORMAT) as tar:
-        info = _pinned_tarinfo(tar, yaml_path, 'packagesite.yaml')
+        info = _pinned_tarinfo(tar, yaml_path, member)
         with open(yaml_path, 'rb') as f:
             tar.addfile(info, f)
     os.remove(yaml_path)
-    link = os.path.join(latest_dir, 'packagesite.pkg')
+    link = os.path.join(latest_dir, f'{archive}.pkg')
     if os.path.lexists(link):
         os.unlink(link)
-    os.symlink('./packagesite.tzst', link)
+    os.symlink(f'./{archive}.tzst', link)
+
+def _create_data_tzst(latest_dir, packages, meta_conf, compression=None):
+    """
+    Write the pkg 2 repository catalogue next to the packagesite.
+
+    Recent pkg fetches the whole catalogue as one JSON document,
+    {"packages": [...]} with the same entries as packagesite.yaml, instead
+    of the line-oriented packagesite. meta.conf names it: data is the
+    member (and the default archive name), data_archive the archive.
+    """
+    member = meta_conf['data']
+    archive = meta_conf.get('data_archive', member)
+    with open(os.path.join(latest_dir, member), 'w') as f:
+        json.dump({'packages': packages}, f, separators=(',', ':'))
+    _create_packagesite_tzst(latest_dir, compression, archive, member)
 
 INDEX_HEADER = """<!DOCTYPE html>
 <html lang="en">
@@ -436,33 +1134,81 @@ def _readable_size(size):
             return f'{size} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
         size /= 1024
 
-def _index_time(path):
-    return datetime.datetime.fromtimestamp(os.stat(path).st_ctime, tz=datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-
-def _generate_index_tree(base_dir):
-    """Write an index.html into every directory of base_dir."""
-    for root, dirs, files in os.walk(base_dir):
-        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
-        names = sorted(f for f in files if not f.startswith('.'))
-        rel = os.path.relpath(root, base_dir)
-        label = 'Index of /' if rel == '.' else f'Index of {rel}'
-        with open(os.path.join(root, 'index.html'), 'w') as fh:
-            fh.write(INDEX_HEADER)
-            fh.write(f'<h1>{label}</h1>')
-            fh.write('<table>')
-            fh.write('<tr><th>Name</th><th>Size</th><th>Creation Date (UTC)</th></tr>')
-            if rel != '.':
-                fh.write("<tr><td><a href='../index.html'>..</a></td><td>-</td><td>-</td></tr>")
-            fh.writelines(
-                f"<tr><td><a href='./{d}/index.html'>{d}/</a></td><td>-</td><td>{_index_time(os.path.join(root, d))}</td></tr>"
-                for d in dirs)
-            for name in names:
-                st = os.stat(os.path.join(root, name))
-                fh.write(f"<tr><td><a href='{name}'>{name}</a></td><td>{_readable_size(st.st_size)}</td><td>{_index_time(os.path.join(root, name))}</td></tr>")
-            fh.write('</table>')
-            fh.write(INDEX_FOOTER)
-
-def _plugin_hooks(payload_dir, pkg_name):
+def _index_time(st):
+    return datetime.datetime.fromtimestamp(st.st_ctime, tz=datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+# generated per directory; never listed themselves, so a rerun renders the same page
+INDEX_FILES = ('index.html', 'index.json')
+
+def _index_listing(directory):
+    """One scandir pass over directory: sorted (subdirs, files) DirEntries, dot entries and index files skipped."""
+    dirs, files = [], []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith('.') or entry.name in INDEX_FILES:
+                continue
+            (dirs if entry.is_dir() else files).append(entry)
+    return sorted(dirs, key=lambda e: e.name), sorted(files, key=lambda e: e.name)
+
+def _write_if_changed(path, content):
+    """Write content to path unless the file already holds exactly that; return whether it was written."""
+    data = content.encode()
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(data) + 1) == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+def _generate_index_tree(base_dir, index_json=False, directory=None):
+    """
+    Write an index.html (and with index_json an index.json) into every directory of base_dir.
+
+    Each directory is listed with a single scandir pass and one stat per
+    entry. Pages are only rewritten when their rendered content changes,
+    and subdirectories are indexed before their parent, so the parent lists
+    their final ctimes and an unchanged tree is left untouched on a rerun.
+
+    Returns:
+        int: Number of index files (re)written.
+    """
+    directory = base_dir if directory is None else directory
+    dirs, files = _index_listing(directory)
+    written = sum(_generate_index_tree(base_dir, index_json, d.path) for d in dirs if not d.is_symlink())
+    dir_stats = [(d.name, d.stat()) for d in dirs]
+    file_stats = [(f.name, f.stat()) for f in files]
+
+    rel = os.path.relpath(directory, base_dir)
+    label = 'Index of /' if rel == '.' else f'Index of {rel}'
+    rows = ['<tr><th>Name</th><th>Size</th><th>Creation Date (UTC)</th></tr>']
+    if rel != '.':
+        rows.append("<tr><td><a href='../index.html'>..</a></td><td>-</td><td>-</td></tr>")
+    rows.extend(f"<tr><td><a href='./{name}/index.html'>{name}/</a></td><td>-</td><td>{_index_time(st)}</td></tr>"
+                for name, st in dir_stats)
+    rows.extend(f"<tr><td><a href='{name}'>{name}</a></td><td>{_readable_size(st.st_size)}</td><td>{_index_time(st)}</td></tr>"
+                for name, st in file_stats)
+    page = f"{INDEX_HEADER}<h1>{label}</h1><table>{''.join(rows)}</table>{INDEX_FOOTER}"
+    written += _write_if_changed(os.path.join(directory, 'index.html'), page)
+    if index_json:
+        listing = {
+            'path': '/' if rel == '.' else f'/{rel}',
+            'directories': [{'name': name, 'ctime': int(st.st_ctime)} for name, st in dir_stats],
+            'files': [{'name': name, 'size': st.st_size, 'ctime': int(st.st_ctime)} for name, st in file_stats],
+        }
+        written += _write_if_changed(os.path.join(directory, 'index.json'), json.dumps(listing, indent=2) + '\n')
+    return written
+
+def _index_children(index, directory):
+    """Sorted names directly below directory in the payload index (empty if it holds nothing)."""
+    prefix = directory.rstrip('/') + '/'
+    return sorted({entry.arcname[len(prefix):].split('/', 1)[0]
+                   for entry in index if entry.arcname.startswith(prefix)})
+
+
+def _plugin_hooks(index, pkg_name):
     """Derive the pkg lifecycle scripts from what the plugin payload ships.
 
     Mirrors the opnsense/plugins framework Templates: actions.d -> configd
@@ -471,29 +1217,26 @@ def _plugin_hooks(payload_dir, pkg_name):
     the plugin (system.firmware.plugins) on install and unregisters it on
     deinstall, so Firmware -> Plugins shows the plugin as configured instead of
     'misconfigured' when installed directly with pkg (the firmware UI normally
-    runs register.php itself).
+    runs register.php itself). The payload is read from its index, so staged
+    and overlay members count alike.
     """
-    base = os.path.join(payload_dir, 'usr/local/opnsense')
+    base = '/usr/local/opnsense'
     post, deinstall = [], []
-    if os.path.isdir(os.path.join(base, 'service/conf/actions.d')):
+    if _index_children(index, f'{base}/service/conf/actions.d'):
         post.append('if [ -f /usr/local/etc/rc.d/configd ]; then /usr/local/etc/rc.d/configd restart; fi')
-    models_dir = os.path.join(base, 'mvc/app/models/OPNsense')
-    if os.path.isdir(models_dir):
-        for module in sorted(os.listdir(models_dir)):
-            post.append(f'if [ -f /usr/local/opnsense/mvc/script/run_migrations.php ]; '
-                        f'then /usr/local/opnsense/mvc/script/run_migrations.php OPNsense/{module}; fi')
-    tpl_dir = os.path.join(base, 'service/templates/OPNsense')
-    if os.path.isdir(tpl_dir):
-        for module in sorted(os.listdir(tpl_dir)):
-            post.append(f'if [ -f /usr/local/sbin/configctl ]; then echo -n "Reloading template OPNsense/{module}: "; '
-                        f'/usr/local/sbin/configctl template reload OPNsense/{module}; fi')
-    if os.path.isdir(os.path.join(payload_dir, 'usr/local/etc/inc/plugins.inc.d')):
+    for module in _index_children(index, f'{base}/mvc/app/models/OPNsense'):
+        post.append(f'if [ -f /usr/local/opnsense/mvc/script/run_migrations.php ]; '
+                    f'then /usr/local/opnsense/mvc/script/run_migrations.php OPNsense/{module}; fi')
+    for module in _index_children(index, f'{base}/service/templates/OPNsense'):
+        post.append(f'if [ -f /usr/local/sbin/configctl ]; then echo -n "Reloading template OPNsense/{module}: "; '
+                    f'/usr/local/sbin/configctl template reload OPNsense/{module}; fi')
+    if _index_children(index, '/usr/local/etc/inc/plugins.inc.d'):
         post.append('if [ -f /usr/local/etc/rc.configure_plugins ]; then echo "Reloading plugin configuration"; '
                     '/usr/local/etc/rc.configure_plugins post-install; fi')
         deinstall.append('if [ -f /usr/local/etc/rc.configure_plugins ]; then echo "Reloading plugin configuration"; '
                          '/usr/local/etc/rc.configure_plugins post-deinstall; fi')
     register = '/usr/local/opnsense/scripts/firmware/register.php'
-    if os.path.isdir(os.path.join(payload_dir, 'usr/local/opnsense/version')):
+    if _index_children(index, f'{base}/version'):
         post.append(f'if [ -f {register} ]; then {register} install {pkg_name}; fi')
         deinstall.append(f'if [ -f {register} ]; then {register} remove {pkg_name}; fi')
     scripts = {}
@@ -504,9 +1247,9 @@ def _plugin_hooks(payload_dir, pkg_name):
     return scripts
 
 
-def _plugin_package(payload_dir, plugin, manifest, arch, version):
-    """Stage the OPNsense version annotation into the payload; return
-    (os-prefixed package name, product annotation, lifecycle scripts)."""
+def _plugin_package(index, plugin, manifest, arch, version):
+    """Build the OPNsense version annotation as a virtual payload member; return
+    (os-prefixed package name, product annotation, lifecycle scripts, annotation entry)."""
     name = manifest['name']
     pkg_name = f"os-{name}"
     annotation = {
@@ -521,15 +1264,12 @@ def _plugin_package(payload_dir, plugin, manifest, arch, version):
         'product_version': str(version),
         'product_website': str(manifest.get('www', '')),
     }
-    ver_dir = os.path.join(payload_dir, 'usr/local/opnsense/version')
-    os.makedirs(ver_dir, exist_ok=True)
-    with open(os.path.join(ver_dir, name), 'w') as f:
-        json.dump(annotation, f, indent=2)
-    return pkg_name, annotation, _plugin_hooks(payload_dir, pkg_name)
+    entry = _virtual_entry(f'/usr/local/opnsense/version/{name}', json.dumps(annotation, indent=2).encode())
+    return pkg_name, annotation, _plugin_hooks(_with_members(index, [entry]), pkg_name), entry
 
 
-def _stage_licenses(payload_dir, pkg_name, version, licenses):
-    """Copy license texts into the payload's /usr/local/share/licenses dir.
+def _license_entries(index, pkg_name, version, licenses):
+    """Map license texts into the package's /usr/local/share/licenses dir.
 
     Firmware -> Packages reads licenses from
     /usr/local/share/licenses/<pkg>-<version>/<LICENSE_ID> (license.sh), so
@@ -539,46 +1279,52 @@ def _stage_licenses(payload_dir, pkg_name, version, licenses):
     Sources are the staged doc LICENSE files. For a single-license package the
     bare /usr/local/share/doc/<dir>/LICENSE is used; multi-license packages
     stage explicit per-license files (LICENSE.<ID>) next to it so pkg-tool
-    can map each declared ID to its text.
+    can map each declared ID to its text. The returned entries alias their
+    source (same file, same digest, mode 0644), so nothing is copied.
     """
-    if not licenses:
-        return
-    doc_root = os.path.join(payload_dir, 'usr/local/share/doc')
-    if not os.path.isdir(doc_root):
-        return
+    docs = [entry for entry in index if entry.arcname.startswith('/usr/local/share/doc/')]
+    if not licenses or not docs:
+        return []
     explicit = {}
     generic = []
-    for root, _, files in os.walk(doc_root):
-        for f in files:
-            if f == 'LICENSE':
-                generic.append(os.path.join(root, f))
-            elif f.startswith('LICENSE.'):
-                explicit[f[len('LICENSE.'):]] = os.path.join(root, f)
-
-    lic_dir = os.path.join(payload_dir, 'usr/local/share/licenses', f'{pkg_name}-{version}')
-    os.makedirs(lic_dir, exist_ok=True)
+    for entry in docs:
+        if entry.link is not None:
+            continue
+        f = posixpath.basename(entry.arcname)
+        if f == 'LICENSE':
+            generic.append(entry)
+        elif f.startswith('LICENSE.'):
+            explicit[f[len('LICENSE.'):]] = entry
+
+    lic_dir = f'/usr/local/share/licenses/{pkg_name}-{version}'
+    entries = []
     for lic_id in licenses:
         source = explicit.get(lic_id)
         if source is None and len(licenses) == 1 and len(generic) == 1:
             # Single-license package: the bare staged LICENSE is the text.
             source = generic[0]
-        if source and os.path.isfile(source):
-            target = os.path.join(lic_dir, lic_id)
-            shutil.copyfile(source, target)
-            os.chmod(target, 0o644)
+        if source:
+            entries.append(source._replace(arcname=f'{lic_dir}/{lic_id}', mode=0o644))
         else:
-            print(f"warning: no staged license text found for {pkg_name} license {lic_id}; "
-                  f"Firmware -> Packages will report a missing license file")
+            logging.getLogger(__name__).warning(
+                f"no staged license text found for {pkg_name} license {lic_id}; "
+                f"Firmware -> Packages will report a missing license file")
+    return entries
 
 
-def pack(config_path, abi, arch, payload_dir='pkg', output_dir='.'):
+def pack(config_path, abi, arch, payload_dir='pkg', output_dir='.', jobs=None, compression=None,
+         digest_cache=None, digest_cache_entries=DIGEST_CACHE_MAX_ENTRIES, output_cache=None,
+         output_cache_max_bytes=OUTPUT_CACHE_MAX_BYTES, keep_payload=False):
     """
     Pack a staged payload into a FreeBSD package.
 
     The payload is a FreeBSD staging root (the tree a build script fills,
-    e.g. usr/local/...). For plugin specs the package is packed with the
-    os- prefix, the OPNsense version annotation and auto-derived lifecycle
-    hooks. This performs the whole packing sequence: manifests, the
+    e.g. usr/local/...), overlaid with the spec's payload mapping, whose
+    sources are packed in place instead of being copied into the staging
+    root first; the staging root may be absent when the mapping covers the
+    whole package. For plugin specs the package is packed with the os-
+    prefix, the OPNsense version annotation (generated in memory) and
+    auto-derived lifecycle hooks. This performs the whole packing sequence: manifests, the
     zstd-compressed package, the packagesite info, and cleanup of its own
     staging.
 
@@ -587,17 +1333,43 @@ def pack(config_path, abi, arch, payload_dir='pkg', output_dir='.'):
         abi (str): ABI string.
         arch (str): Architecture string.
         payload_dir (str): Directory containing the staged payload. Defaults to 'pkg'.
+            Removed after packing; mapped sources are never touched.
         output_dir (str): Directory to output the package. Defaults to the current directory.
+        jobs (int): Worker threads for hashing the payload. Defaults to the CPU count.
+        compression (dict): zstd overrides (level/threads/long); falls back to
+            build_config.compression from the spec.
+        digest_cache (str): Path to the opt-in payload digest cache; unchanged
+            files are not rehashed across runs. Disabled when omitted.
+        digest_cache_entries (int): LRU bound of the digest cache.
+        output_cache (str): Directory of previously packed artifacts keyed by
+            input fingerprint; a hit reuses the cached .pkg and packagesite
+            info instead of repacking. Disabled when omitted.
+        output_cache_max_bytes (int): Size bound of the output cache; least
+            recently used entries are evicted beyond it.
+        keep_payload (bool): Leave payload_dir in place instead of removing
+            it (pack_batch removes a payload shared by several jobs itself).
     """
-    if not os.path.isdir(payload_dir):
-        raise FileNotFoundError(f"Payload directory not found: {payload_dir}")
     pkg_config = _load_spec(config_path)
+    mapping = pkg_config.get('payload')
+    if not os.path.isdir(payload_dir) and not mapping:
+        raise FileNotFoundError(f"Payload directory not found: {payload_dir}")
     manifest = pkg_config['pkg_manifest']
     version = str(manifest['version'])
 
+    with _phase('scan') as counters:
+        index = _walk_payload(payload_dir) if os.path.isdir(payload_dir) else []
+        if mapping:
+            overlay = _walk_overlay(mapping, os.path.dirname(os.path.abspath(config_path)))
+            shadowed = sorted({entry.arcname for entry in index} & {entry.arcname for entry in overlay})
+            if shadowed:
+                raise ValueError(f"{config_path}: payload mapping shadows staged file {shadowed[0]}")
+            index = _with_members(index, overlay)
+        counters['files'] = len(index)
+
     if pkg_config.get('plugin'):
-        name, annotation, scripts = _plugin_package(
-            payload_dir, pkg_config['plugin'], manifest, arch, version)
+        name, annotation, scripts, annotation_entry = _plugin_package(
+            index, pkg_config['plugin'], manifest, arch, version)
+        index = _with_members(index, [annotation_entry])
         manifest['name'] = name
         manifest['origin'] = f"opnware/{name}"
         manifest['scripts'] = scripts
@@ -605,17 +1377,229 @@ def pack(config_path, abi, arch, payload_dir='pkg', output_dir='.'):
     else:
         name = manifest['name'].lower()
 
-    _stage_licenses(payload_dir, name, version, manifest.get('licenses', []))
-    _create_manifest(config_path, abi, arch, payload_dir, output_dir, spec=pkg_config)
+    with _phase('hash') as counters:
+        cache = _digest_cache_for(digest_cache) if digest_cache else None
+        index = _hash_index(index, jobs, cache)
+        if digest_cache:
+            _save_digest_cache(digest_cache, cache, digest_cache_entries)
+        counters['files'] = len(index)
+        counters['bytes_in'] = sum(entry.stat.st_size for entry in index if entry.link is None)
+    index = _with_members(index, _license_entries(index, name, version, manifest.get('licenses', [])))
     pkg_file = os.path.join(output_dir, _pkg_filename(name, version))
-    _create_pkg(pkg_file, output_dir, payload_dir)
-    _create_packagesite_info(os.path.join(output_dir, '+COMPACT_MANIFEST'), output_dir)
+    compression = _compression_settings(pkg_config['build_config'].get('compression'), compression)
+
+    cached = None
+    if output_cache:
+        cached = os.path.join(output_cache, _pack_fingerprint(pkg_config, abi, arch, index, compression))
+        if _restore_cached_pack(cached, pkg_file, output_dir):
+            logging.getLogger(__name__).info(f'Reusing cached {os.path.basename(pkg_file)} from: {cached}')
+            if os.path.isdir(payload_dir) and not keep_payload:
+                shutil.rmtree(payload_dir)
+            return
+
+    with _phase('manifest') as counters:
+        _create_manifest(config_path, abi, arch, payload_dir, output_dir, spec=pkg_config, index=index)
+        counters['files'] = 2
+        counters['bytes_out'] = sum(os.path.getsize(os.path.join(output_dir, name))
+                                    for name in ('+MANIFEST', '+COMPACT_MANIFEST'))
+    with _phase('compress') as counters:
+        digest = _create_pkg(pkg_file, output_dir, payload_dir, index=index, compression=compression)
+        counters['files'] = len(index) + 2
+        counters['bytes_in'] = sum(entry.stat.st_size for entry in index if entry.link is None)
+        counters['bytes_out'] = digest[1]
+    with _phase('packagesite info') as counters:
+        _create_packagesite_info(os.path.join(output_dir, '+COMPACT_MANIFEST'), output_dir, digest)
+        counters['files'] = 1
+        counters['bytes_out'] = os.path.getsize(os.path.join(output_dir, 'packagesite_info.json'))
 
     os.remove(os.path.join(output_dir, '+MANIFEST'))
     os.remove(os.path.join(output_dir, '+COMPACT_MANIFEST'))
-    shutil.rmtree(payload_dir)
+    if os.path.isdir(payload_dir) and not keep_payload:
+        shutil.rmtree(payload_dir)
+    if cached:
+        _store_cached_pack(cached, pkg_file, output_dir)
+        _evict_output_cache(output_cache, output_cache_max_bytes)
+
+# Bump whenever pack's output changes for identical inputs, so cached
+# artifacts from older pkg-tool versions stop matching.
+PACK_FORMAT = 1
+
+def _pack_fingerprint(spec, abi, arch, index, compression):
+    """sha256 over everything that determines the packed bytes: spec, ABI/arch, zstd settings, payload index."""
+    fingerprint = hashlib.sha256()
+    fingerprint.update(json.dumps(
+        {'format': PACK_FORMAT, 'spec': spec, 'abi': str(abi), 'arch': str(arch), 'compression': compression},
+        sort_keys=True, default=str).encode())
+    for entry in index:
+        # mtime/uid/gid are pinned in the package, so only mode, link and content count
+        fingerprint.update(json.dumps(
+            [entry.arcname, _payload_tarinfo(entry).mode, entry.link, entry.digest]).encode() + b'\n')
+    return fingerprint.hexdigest()
+
+def _restore_cached_pack(cached, pkg_file, output_dir):
+    """Copy a cached .pkg + packagesite_info.json into output_dir; False on a cache miss."""
+    cached_pkg = os.path.join(cached, os.path.basename(pkg_file))
+    cached_info = os.path.join(cached, 'packagesite_info.json')
+    try:
+        shutil.copyfile(cached_pkg, pkg_file)
+        shutil.copyfile(cached_info, os.path.join(output_dir, 'packagesite_info.json'))
+        os.utime(cached)  # orders the least-recently-used eviction
+    except FileNotFoundError:
+        # not cached, or evicted by a concurrent pack meanwhile
+        return False
+    return True
+
+def _store_cached_pack(cached, pkg_file, output_dir):
+    """Publish a fresh pack into the output cache; the rename makes the entry appear atomically."""
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'{os.path.basename(cached)}.', suffix='.tmp', dir=os.path.dirname(cached))
+    shutil.copyfile(pkg_file, os.path.join(staging, os.path.basename(pkg_file)))
+    shutil.copyfile(os.path.join(output_dir, 'packagesite_info.json'), os.path.join(staging, 'packagesite_info.json'))
+    try:
+        os.rename(staging, cached)
+    except OSError:
+        # an identical entry was stored concurrently (or a stale one exists)
+        shutil.rmtree(staging)
+
+def _evict_output_cache(output_cache, max_bytes):
+    """Drop least recently used output cache entries until they fit in max_bytes."""
+    entries = []
+    with os.scandir(output_cache) as it:
+        for entry in it:
+            if entry.name.endswith('.tmp') or not entry.is_dir(follow_symlinks=False):
+                continue  # another pack's staging
+            with contextlib.suppress(FileNotFoundError):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime_ns, size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        # move the entry out of the way first, so no pack restores it half removed
+        doomed = f'{path}.{os.getpid()}.evicted.tmp'
+        with contextlib.suppress(FileNotFoundError):
+            os.rename(path, doomed)
+            shutil.rmtree(doomed)
+        total -= size
+
+def _load_batch_jobs(jobs_file):
+    """Read pack-batch jobs from a JSON file ('-' for stdin); pack_batch validates them."""
+    if jobs_file == '-':
+        return json.load(sys.stdin)
+    with open(jobs_file) as f:
+        return json.load(f)
+
+def _validate_batch_jobs(jobs):
+    """Check pack-batch jobs: a non-empty list of mappings with known keys and distinct output dirs."""
+    if not isinstance(jobs, list) or not jobs:
+        raise TypeError("pack-batch jobs must be a non-empty list")
+    output_dirs = {}
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise TypeError(f"pack-batch job {i} is not a mapping")
+        for key in ('config', 'abi', 'arch'):
+            if key not in job:
+                raise ValueError(f"pack-batch job {i}: {key} missing")
+        for key in job:
+            if key not in ('config', 'payload_dir', 'abi', 'arch', 'output_dir'):
+                raise ValueError(f"pack-batch job {i}: unknown key {key!r}")
+        # pack writes fixed-name manifests and packagesite_info.json into its
+        # output dir, so concurrent jobs sharing one would clobber each other
+        output_dir = os.path.realpath(job.get('output_dir', '.'))
+        if output_dir in output_dirs:
+            raise ValueError(f"pack-batch job {i}: output_dir {job.get('output_dir', '.')!r} "
+                             f"is already used by job {output_dirs[output_dir]}")
+        output_dirs[output_dir] = i
+
+def _pack_job(job, options, profile=False):
+    """pack() one batch job in a worker; failures become a result entry instead of raising.
+
+    With profile, the job's phase records are returned in the result, since
+    the worker's own records never reach the parent process.
+    """
+    global profile_phases
+    result = {'config': job['config'], 'abi': str(job['abi']), 'arch': str(job['arch'])}
+    profile_phases = [] if profile else None
+    try:
+        pack(job['config'], str(job['abi']), str(job['arch']), job.get('payload_dir', 'pkg'),
+             job.get('output_dir', '.'), **options)
+    except (TypeError, ValueError, FileNotFoundError, KeyError, OSError, zstd.ZstdError) as e:
+        result.update(status='error', error=str(e))
+    else:
+        result['status'] = 'ok'
+    if profile:
+        result['profile'] = profile_phases
+    return result
+
+def pack_batch(jobs, workers=None, compression=None, digest_cache=None,
+               digest_cache_entries=DIGEST_CACHE_MAX_ENTRIES, output_cache=None,
+               output_cache_max_bytes=OUTPUT_CACHE_MAX_BYTES):
+    """
+    Pack many staged payloads concurrently in one pkg-tool invocation.
 
-def redistribute_pkg(config_path, abi, arch, output_dir='.'):
+    Jobs run in a process pool; each worker process keeps its zstd contexts
+    and digest cache across the jobs it runs. A failing job is reported in
+    its result entry and does not stop the rest of the batch. A payload_dir
+    several jobs pack (e.g. one staged tree for amd64 and aarch64) is
+    removed once all of them have finished, and only if all succeeded, as
+    pack removes its payload on success.
+
+    Args:
+        jobs (list): Mappings with config, abi, arch and optional payload_dir
+            (default 'pkg') and output_dir (default '.'), as for pack.
+        workers (int): Worker processes. Defaults to the CPU count.
+        compression (dict): zstd overrides applied to every job.
+        digest_cache (str): Shared payload digest cache file (see pack).
+        digest_cache_entries (int): LRU bound of the digest cache.
+        output_cache (str): Shared packed-artifact cache directory (see pack).
+        output_cache_max_bytes (int): Size bound of the output cache.
+
+    Returns:
+        list: One result per job, in job order: config, abi, arch, status
+        ('ok' or 'error') and, for failures, error. While profiling, each
+        job's phases are added to the profile, prefixed with the job.
+    """
+    _validate_batch_jobs(jobs)
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    payloads = collections.Counter(os.path.realpath(job.get('payload_dir', 'pkg')) for job in jobs)
+    shared = {payload for payload, count in payloads.items() if count > 1}
+    options = {
+        # split the cores between the workers instead of oversubscribing them
+        'jobs': max(1, (os.cpu_count() or 1) // workers),
+        'compression': compression,
+        'digest_cache': digest_cache,
+        'digest_cache_entries': digest_cache_entries,
+        'output_cache': output_cache,
+        'output_cache_max_bytes': output_cache_max_bytes,
+    }
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_pack_job, job,
+                               dict(options, keep_payload=os.path.realpath(job.get('payload_dir', 'pkg')) in shared),
+                               profile_phases is not None) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                result = future.result()
+            except (concurrent.futures.process.BrokenProcessPool, OSError) as e:
+                # a crashed worker only fails its jobs; _pack_job reports every other failure itself
+                results.append({'config': job['config'], 'abi': str(job['abi']), 'arch': str(job['arch']),
+                                'status': 'error', 'error': f'worker failed: {e!r}'})
+                continue
+            if profile_phases is not None:
+                label = f"{job['config']} {job['abi']}/{job['arch']}"
+                profile_phases.extend(dict(record, phase=f"{label}: {record['phase']}")
+                                      for record in result.pop('profile'))
+            results.append(result)
+    for payload in shared:
+        packed = [result['status'] == 'ok' for job, result in zip(jobs, results)
+                  if os.path.realpath(job.get('payload_dir', 'pkg')) == payload]
+        if all(packed) and os.path.isdir(payload):
+            shutil.rmtree(payload)
+    return results
+
+def redistribute_pkg(config_path, abi, arch, output_dir='.', cache_dir=None, session=None):
     """
     Redistribute package.
 
@@ -623,6 +1607,16 @@ def redistribute_pkg(config_path, abi, arch, output_dir='.'):
         config_path (str): Path to the config.yml file.
         abi (str): ABI string.
         arch (str): Architecture string.
+        output_dir (str): Directory to output the package and its packagesite info.
+        cache_dir (str): Content-addressed cache of upstream packages, keyed
+            by the sum the upstream packagesite lists for the pinned
+            version. A verified cached copy is reused without downloading;
+            a download must match the sum before it is used and cached.
+            Disabled when omitted (no verification). A version the
+            packagesite does not list is downloaded unverified, with a
+            warning, as without the cache.
+        session (requests.Session): Session the package download reuses
+            connections from.
     """
     pkg_config = _load_spec(config_path)
 
@@ -630,44 +1624,192 @@ def redistribute_pkg(config_path, abi, arch, output_dir='.'):
         dep = pkg_config['redistribute']
         version = dep["version"][f"FreeBSD-{abi}-{arch}"]
         pkg_name = _pkg_filename(dep['name'], version)
+        pkg_file = os.path.join(output_dir, pkg_name)
         pkg_url = f'{dep["repo"]}/FreeBSD:{abi}:{arch}/{dep["path"]}/{pkg_name}'
-        print(f'Loading {pkg_name} from: {pkg_url}')
-        _download_pkg(pkg_url, os.path.join(output_dir, pkg_name))
-        _gen_pkgsite_info_from_pkg(os.path.join(output_dir, pkg_name), output_dir)
+        expected = None
+        if cache_dir:
+            try:
+                expected = _upstream_sum(dep, abi, arch, version)
+            except ValueError as e:
+                # e.g. a quarterly packagesite that moved past the pinned
+                # version: the package itself may still be there
+                logging.getLogger(__name__).warning(
+                    f"{pkg_name}: not verifiable against the upstream packagesite ({e}); "
+                    f"downloading it unverified and uncached")
+        if expected:
+            cached = os.path.join(cache_dir, f'{expected}.pkg')
+            digest = _verified_copy(cached, pkg_file, expected)
+            if digest:
+                logging.getLogger(__name__).info(f'Reusing cached {pkg_name} from: {cached}')
+            else:
+                logging.getLogger(__name__).info(f'Loading {pkg_name} from: {pkg_url}')
+                digest = _download_pkg(pkg_url, pkg_file, session)
+                if digest[0] != expected:
+                    os.remove(pkg_file)
+                    raise ValueError(f"{pkg_url}: sha256 {digest[0]} does not match the upstream packagesite "
+                                     f"sum {expected}")
+                _store_upstream_pkg(pkg_file, cached)
+        else:
+            logging.getLogger(__name__).info(f'Loading {pkg_name} from: {pkg_url}')
+            digest = _download_pkg(pkg_url, pkg_file, session)
+        _gen_pkgsite_info_from_pkg(pkg_file, output_dir, digest)
+
+REDISTRIBUTE_CONCURRENCY = 8
+
+def _redistribute_job(job, output_dir, cache_dir, session):
+    """redistribute_pkg() one spec/ABI/arch into its own output dir; failures become a result entry."""
+    pkg, config_path, abi_arch = job
+    result = {'pkg': pkg, 'abi_arch': abi_arch}
+    try:
+        _, abi, arch = abi_arch.split('-')
+        job_dir = os.path.join(output_dir, pkg, abi_arch)
+        os.makedirs(job_dir, exist_ok=True)
+        redistribute_pkg(config_path, abi, arch, job_dir, cache_dir, session)
+    except (TypeError, ValueError, FileNotFoundError, KeyError, OSError, EOFError, tarfile.TarError,
+            zstd.ZstdError, json.JSONDecodeError, requests.RequestException) as e:
+        result.update(status='error', error=str(e))
+    else:
+        result.update(status='ok', output_dir=job_dir)
+    return result
+
+def redistribute_all(pkgs_dir='pkgs', output_dir='dist', concurrency=REDISTRIBUTE_CONCURRENCY, cache_dir=None):
+    """
+    Redistribute every ABI/arch of every redistribute spec concurrently.
+
+    The downloads run on a thread pool sharing one keep-alive session, so
+    packages from the same mirror reuse its connections instead of each
+    redistribute-pkg run opening its own. Every package lands with its
+    packagesite_info.json in <output_dir>/<pkg>/<FreeBSD-abi-arch>/, ready
+    for assemble-repo. A failing download does not stop the others.
+
+    Args:
+        pkgs_dir (str): Directory containing the package specs.
+        output_dir (str): Directory to output the per-package dirs.
+        concurrency (int): Maximum concurrent downloads (and pooled
+            connections per host).
+        cache_dir (str): Upstream package cache, see redistribute_pkg.
 
-def _create_pkg(pkg_file, output_dir, payload_dir):
+    Returns:
+        list: One result per spec and ABI/arch, in spec order: pkg,
+        abi_arch, status ('ok' or 'error') and output_dir or error.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    jobs = []
+    for config_file in sorted(Path(pkgs_dir).glob('*/config.yml')):
+        config = _load_spec(config_file)
+        if config.get('redistribute'):
+            jobs.extend((config_file.parent.name, str(config_file), abi_arch)
+                        for abi_arch in config['redistribute']['version'])
+    if not jobs:
+        return []
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    with session, concurrent.futures.ThreadPoolExecutor(max_workers=min(concurrency, len(jobs))) as pool:
+        return list(pool.map(functools.partial(_redistribute_job, output_dir=output_dir, cache_dir=cache_dir,
+                                               session=session), jobs))
+
+def _upstream_sum(dep, abi, arch, version):
+    """The sha256 the upstream packagesite lists for the pinned version of a redistribute spec."""
+    path = dep['path'].split('/')[0]
+    package = _load_packagesite(dep['repo'], f'FreeBSD-{abi}-{arch}', path).get(dep['name'])
+    if package is not None and str(package.get('version')) == str(version):
+        return package['sum']
+    raise ValueError(f"{dep['name']} {version} not found in packagesite from {dep['repo']}")
+
+def _verified_copy(cached, pkg_file, expected):
+    """Place a cached upstream package at pkg_file if its content still hashes to expected.
+
+    Returns:
+        tuple: (sha256, size) of the placed package, or None on a miss (a
+        corrupt cache entry is dropped).
+    """
+    if not os.path.exists(cached):
+        return None
+    if _sha256sum(cached) != expected:
+        logging.getLogger(__name__).warning(f"{cached}: cached package is corrupt, dropping it")
+        os.remove(cached)
+        return None
+    _place_pkg(cached, pkg_file, 'hardlink')
+    return expected, os.path.getsize(pkg_file)
+
+def _store_upstream_pkg(pkg_file, cached):
+    """Add a verified download to the upstream package cache, atomically."""
+    os.makedirs(os.path.dirname(cached) or '.', exist_ok=True)
+    staging = f'{cached}.{os.getpid()}.tmp'
+    _place_pkg(pkg_file, staging, 'hardlink')
+    os.replace(staging, cached)
+
+class _DigestWriter:
+    """Write-through file wrapper that hashes and counts every byte it passes on."""
+
+    def __init__(self, fobj):
+        self._fobj = fobj
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._fobj.write(data)
+
+    def flush(self):
+        self._fobj.flush()
+
+    def absorb(self, size):
+        """Account for the first size bytes already in the file (a resumed
+        download) and position the file after them."""
+        self._fobj.seek(0)
+        while self.size < size:
+            data = self._fobj.read(min(DOWNLOAD_CHUNK, size - self.size))
+            if not data:
+                raise OSError(f"{self._fobj.name}: shorter than {size} bytes")
+            self._hash.update(data)
+            self.size += len(data)
+
+    def digest(self):
+        """(sha256 hex digest, byte count) of everything written so far."""
+        return self._hash.hexdigest(), self.size
+
+def _create_pkg(pkg_file, output_dir, payload_dir, index=None, compression=None):
     """
     Create the zstd-compressed package.
 
     Mirrors the previous shell tail: +COMPACT_MANIFEST and +MANIFEST first,
     then payload files, then payload symlinks. Members are owned by uid/gid 0
     and names keep the leading '/' the historical GNU tar output had. mtime is
-    pinned to 0 for reproducible builds.
-    """
-    files, links = [], []
-    for root, dirs, names in os.walk(payload_dir):
-        dirs.sort()
-        for name in sorted(names):
-            path = os.path.join(root, name)
-            (links if os.path.islink(path) else files).append(path)
-
-    members = [
-        (os.path.join(output_dir, '+COMPACT_MANIFEST'), '+COMPACT_MANIFEST'),
-        (os.path.join(output_dir, '+MANIFEST'), '+MANIFEST'),
-    ]
-    members += [(path, '/' + os.path.relpath(path, payload_dir)) for path in files]
-    members += [(path, '/' + os.path.relpath(path, payload_dir)) for path in links]
+    pinned to 0 for reproducible builds. Payload members come from the payload
+    index (scanned from payload_dir when omitted), so nothing is re-stat'ed.
+    compression holds the zstd settings (see _zstd_compressor).
 
-    cctx = zstd.ZstdCompressor()
-    with open(pkg_file, 'wb') as fobj, cctx.stream_writer(fobj) as zobj, \
-            tarfile.open(fileobj=zobj, mode='w|', format=tarfile.PAX_FORMAT) as tar:
-        for path, arcname in members:
-            info = _pinned_tarinfo(tar, path, arcname)
-            if info.isfile():
+    Returns:
+        tuple: (sha256, size) of the written .pkg, digested while writing.
+    """
+    if index is None:
+        index = _scan_payload(payload_dir)
+    files = [entry for entry in index if entry.link is None]
+    links = [entry for entry in index if entry.link is not None]
+
+    cctx = _zstd_compressor(compression)
+    with open(pkg_file, 'wb') as fobj:
+        writer = _DigestWriter(fobj)
+        with cctx.stream_writer(writer, closefd=False) as zobj, \
+                tarfile.open(fileobj=zobj, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            for name in ('+COMPACT_MANIFEST', '+MANIFEST'):
+                path = os.path.join(output_dir, name)
                 with open(path, 'rb') as f:
-                    tar.addfile(info, f)
-            else:
-                tar.addfile(info)
+                    tar.addfile(_pinned_tarinfo(tar, path, name), f)
+            for entry in files:
+                if entry.data is not None:
+                    tar.addfile(_payload_tarinfo(entry), io.BytesIO(entry.data))
+                    continue
+                with open(entry.path, 'rb') as f:
+                    tar.addfile(_payload_tarinfo(entry), f)
+            for entry in links:
+                tar.addfile(_payload_tarinfo(entry))
+    return writer.digest()
 
 def _sha256sum(file):
     """
@@ -682,44 +1824,120 @@ def _sha256sum(file):
     with open(file, 'rb', buffering=0) as f:
         return hashlib.file_digest(f, 'sha256').hexdigest()
 
-def _folder_size(folder):
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_BACKOFF = 1.0  # seconds before the first retry; doubles with every further one
+DOWNLOAD_CHUNK = 1 << 20
+DOWNLOAD_TIMEOUT = 30  # per connect / per read, not for the whole transfer
+
+def _download_pkg(url, file, session=None, retries=DOWNLOAD_RETRIES):
     """
-    Calculate the total size of a folder.
+    Download a package from a URL.
+
+    The body is streamed in chunks into <file>.part and hashed on the fly,
+    so memory stays constant however big the package is. Connection errors,
+    timeouts, truncated bodies and 429/5xx answers are retried with
+    exponential backoff; each retry resumes the partial file with an HTTP
+    Range request guarded by If-Range, so a package that changed meanwhile
+    is sent whole (starting over as well if the server ignores the range or
+    its Content-Range does not continue the partial file). A .part left by
+    an earlier call is discarded, as is the partial file once the download
+    gives up. The finished file is renamed into place atomically, so file
+    never holds a partial package.
 
     Args:
-        folder (str): Path to the folder.
+        url (str): URL of the package.
+        file (str): Path to save the downloaded package.
+        session (requests.Session): Session to reuse connections from.
+            Defaults to a one-off connection.
+        retries (int): Retries after the first attempt.
 
     Returns:
-        int: Total size of the folder in bytes.
+        tuple: (sha256, size) of the saved package, digested while writing.
     """
-    total_size = 0
-    for dirpath, _, filenames in os.walk(folder):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            if not os.path.islink(fp):
-                total_size += os.path.getsize(fp)
-    return total_size
+    part = f'{file}.part'
+    # an earlier run's leftover may belong to another revision of url
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(part)
+    remote = {}
+    try:
+        for attempt in range(retries + 1):
+            try:
+                digest = _download_attempt(url, part, session, remote)
+            except requests.RequestException as e:
+                if attempt == retries:
+                    raise ValueError(f"failed to download {url} after {retries + 1} attempts: {e}") from e
+                delay = DOWNLOAD_BACKOFF * 2 ** attempt
+                logging.getLogger(__name__).warning(f"download of {url} failed ({e}); retrying in {delay:g}s")
+                time.sleep(delay)
+            else:
+                os.replace(part, file)
+                return digest
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part)
 
-def _download_pkg(url, file):
+def _download_attempt(url, part, session=None, remote=None):
     """
-    Download a package from a URL.
+    One download attempt into part, resuming what is already there; returns (sha256, size).
 
-    Args:
-        url (str): URL of the package.
-        file (str): Path to save the downloaded package.
+    remote carries the validator (strong ETag, else Last-Modified) of the
+    response that started part from one attempt to the next; a resume sends
+    it as If-Range.
     """
-    with urllib.request.urlopen(url, timeout=30) as req, open(file, 'wb') as f:
-        f.write(req.read())
-
-def _gen_pkgsite_info_from_pkg(pkg, output_dir):
+    remote = {} if remote is None else remote
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    # identity: Content-Length and Range then count the bytes that land in part
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if remote.get('validator'):
+            headers['If-Range'] = remote['validator']
+    with (session or requests).get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416:
+            # the partial file does not match the remote one (anymore); start over
+            os.remove(part)
+            raise requests.HTTPError(f"HTTP 416 resuming at byte {offset}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise requests.HTTPError(f"HTTP {response.status_code}")
+        if response.status_code not in (200, 206):
+            raise ValueError(f"failed to download {url}: HTTP {response.status_code}")
+        if response.status_code == 200:
+            offset = 0  # the server ignored the range, or the package changed, and sends everything
+            etag = response.headers.get('ETag')
+            # If-Range only takes strong validators
+            remote['validator'] = (etag if etag and not etag.startswith('W/')
+                                   else response.headers.get('Last-Modified'))
+        else:
+            content_range = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+            if not content_range or int(content_range.group(1)) != offset:
+                # not the continuation of part; start over
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(part)
+                raise requests.HTTPError(f"HTTP 206 with Content-Range "
+                                         f"{response.headers.get('Content-Range')!r} resuming at byte {offset}")
+        length = response.headers.get('Content-Length')
+        if response.headers.get('Content-Encoding', 'identity') != 'identity':
+            length = None  # counts encoded bytes, not the decoded ones written to part
+        expected = offset + int(length) if length is not None else None
+        with open(part, 'r+b' if offset else 'wb') as f:
+            writer = _DigestWriter(f)
+            writer.absorb(offset)
+            for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                writer.write(chunk)
+    if expected is not None and writer.size != expected:
+        raise requests.ConnectionError(f"connection closed after {writer.size} of {expected} bytes")
+    return writer.digest()
+
+def _gen_pkgsite_info_from_pkg(pkg, output_dir, digest=None):
     """
     Generate package site information from a package file.
 
     Args:
         pkg (str): Package file.
         output_dir (str): Directory to output the packagesite info file.
+        digest (tuple): (sha256, size) of the package if already known.
     """
-    pkg_info = _add_site_fields(_read_packagesite_info(pkg), pkg)
+    pkg_info = _add_site_fields(_read_packagesite_info(pkg), pkg, digest)
     with open(os.path.join(output_dir, "packagesite_info.json"), "w") as f:
         json.dump(pkg_info, f, separators=(',', ':'))
 
@@ -804,14 +2022,262 @@ def bump(pkg, version=None, abi_arch=None):
     with open(config_path, 'w') as f:
         f.write(content)
 
+# {packagesite key: Future of its PackagesiteIndex}; concurrent loads of one
+# packagesite share a single fetch
 packagesite_cache = {}
+packagesite_cache_lock = threading.Lock()
+
+# one keep-alive session per host, shared by the lookup threads
+http_sessions = {}
+http_sessions_lock = threading.Lock()
+HTTP_CONCURRENCY = 8
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 4
+HTTP_BACKOFF = 1.0  # upper bound of the first retry's jittered delay; doubles with every further one
+HTTP_MAX_WAIT = 300  # longest Retry-After or rate limit reset waited out; longer ones fail the request
+HTTP_RATE_LIMIT_RESERVE = 1  # requests held back per host once its rate limit is this low
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# {host: [remaining, reset epoch]} from the last X-RateLimit-* headers, minus requests sent since
+rate_limits = {}
+
+def _http_session(url):
+    """The pooled session of url's host (connections are reused across lookups and threads)."""
+    host = urlparse(url).netloc
+    with http_sessions_lock:
+        session = http_sessions.get(host)
+        if session is None:
+            session = http_sessions[host] = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_CONCURRENCY)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+    return session
+
+def _http_get(url, **kwargs):
+    """GET url over the pooled session of its host, see _http_request."""
+    return _http_request('GET', url, **kwargs)
+
+def _http_request(method, url, retries=HTTP_RETRIES, **kwargs):
+    """
+    Send a request over the pooled session of url's host, retrying transient failures.
+
+    Connection errors, timeouts, 429/5xx answers and rate limit 403s are
+    retried: after Retry-After or the rate limit reset when the server names
+    one (up to HTTP_MAX_WAIT), else after a jittered exponential backoff so
+    concurrent lookups do not retry in lockstep. Requests to a host whose
+    X-RateLimit-Remaining has run down to HTTP_RATE_LIMIT_RESERVE wait for
+    its reset before they are sent.
+
+    Returns:
+        requests.Response: The first final answer, or the last retried one
+        when the retries run out (callers check status_code as usual).
+
+    Raises:
+        ValueError: The request never got an answer.
+    """
+    host = urlparse(url).netloc
+    send = getattr(_http_session(url), method.lower())
+    for attempt in range(retries + 1):
+        _await_rate_limit(host)
+        try:
+            response = send(url, timeout=HTTP_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise ValueError(f"{method} {url} failed after {retries + 1} attempts: {e}") from e
+            reason, delay = str(e), _http_backoff(attempt)
+        else:
+            _note_rate_limit(host, response)
+            delay = _http_retry_delay(response, attempt)
+            if delay is None or attempt == retries:
+                return response
+            reason = f"HTTP {response.status_code}"
+        logging.getLogger(__name__).warning(f"{method} {url} failed ({reason}); retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def _http_backoff(attempt):
+    """Full-jitter exponential backoff before retry number attempt + 1."""
+    return random.uniform(0, HTTP_BACKOFF * 2 ** attempt)
+
+def _http_retry_delay(response, attempt):
+    """Seconds to wait before retrying response, or None if it is final (or the wait would be too long)."""
+    headers = response.headers
+    rate_limited = headers.get('X-RateLimit-Remaining') == '0'
+    if response.status_code not in HTTP_RETRY_STATUSES and not (
+            response.status_code == 403 and (rate_limited or 'Retry-After' in headers)):
+        return None
+    retry_after = headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        delay = int(retry_after)
+    elif rate_limited and str(headers.get('X-RateLimit-Reset', '')).isdigit():
+        delay = max(0, int(headers['X-RateLimit-Reset']) - time.time())
+    else:
+        delay = _http_backoff(attempt)
+    return delay if delay <= HTTP_MAX_WAIT else None
+
+def _note_rate_limit(host, response):
+    """Remember the rate limit a host reported with its answer."""
+    remaining, reset = (response.headers.get(h, '') for h in ('X-RateLimit-Remaining', 'X-RateLimit-Reset'))
+    if str(remaining).isdigit() and str(reset).isdigit():
+        with http_sessions_lock:
+            rate_limits[host] = [int(remaining), int(reset)]
+
+def _await_rate_limit(host):
+    """Claim one request of host's rate limit, first waiting for its reset if the reserve is reached."""
+    with http_sessions_lock:
+        limit = rate_limits.get(host)
+        if limit is None:
+            return
+        if limit[1] <= time.time():
+            del rate_limits[host]  # the window has reset; the next answer tells the new budget
+            return
+        limit[0] -= 1
+        wait = limit[1] - time.time() if limit[0] < HTTP_RATE_LIMIT_RESERVE else 0
+    if 0 < wait <= HTTP_MAX_WAIT:
+        logging.getLogger(__name__).warning(f"{host} rate limit nearly exhausted; waiting {wait:.0f}s for its reset")
+        time.sleep(wait)
+
+HTTP_CACHE_MAX_AGE = 0
+HTTP_CACHE_MAX_BYTES = 256 << 20
+
+HttpCache = collections.namedtuple('HttpCache', 'path max_age max_bytes',
+                                   defaults=(HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_BYTES))
+
+class _CachedResponse:
+    """The parts of a requests.Response the packagesite lookups read, served from the HTTP cache."""
+
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+def _http_cache_paths(cache, url):
+    """(body, meta) paths of url's entry in the on-disk HTTP cache."""
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(cache.path, f'{key}.body'), os.path.join(cache.path, f'{key}.json')
+
+def _http_cache_entry(cache, url):
+    """
+    Read url's cache entry.
+
+    Returns:
+        tuple: (meta, body), or (None, None) when there is no usable entry
+        (missing, unreadable or written for another url).
+    """
+    body_path, meta_path = _http_cache_paths(cache, url)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(body_path, 'rb') as f:
+            body = f.read()
+    except (OSError, json.JSONDecodeError):
+        return None, None
+    if not isinstance(meta, dict) or meta.get('url') != url or meta.get('size') != len(body):
+        return None, None
+    return meta, body
+
+def _http_cache_fresh(cache, url):
+    """url's cached body if its entry is younger than cache.max_age (marking it used), else None."""
+    meta, body = _http_cache_entry(cache, url)
+    if meta is None or time.time() - meta['fetched'] >= cache.max_age:
+        return None
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(_http_cache_paths(cache, url)[0])
+    return body
+
+def _http_cache_store(cache, url, content, etag=None, last_modified=None):
+    """Add (or replace) url's cache entry, then evict down to cache.max_bytes."""
+    body_path, meta_path = _http_cache_paths(cache, url)
+    os.makedirs(cache.path, exist_ok=True)
+    _write_atomic(body_path, content)
+    _write_atomic(meta_path, json.dumps({
+        'url': url, 'size': len(content), 'fetched': time.time(), 'etag': etag, 'last_modified': last_modified,
+    }).encode())
+    _evict_http_cache(cache)
+
+def _write_atomic(path, data):
+    """Replace path with data in one step; readers see the old or the new file, never a partial one."""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _evict_http_cache(cache):
+    """Drop least recently used entries until the cached bodies fit in cache.max_bytes."""
+    entries = []
+    with os.scandir(cache.path) as it:
+        for entry in it:
+            if entry.name.endswith('.body'):
+                with contextlib.suppress(FileNotFoundError):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, body_path in sorted(entries):
+        if total <= cache.max_bytes:
+            break
+        for path in (body_path, body_path[:-len('.body')] + '.json'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        total -= size
+
+def _cached_http_get(url, cache=None, headers=None):
+    """
+    GET url through the on-disk conditional-request cache.
+
+    An entry younger than cache.max_age seconds is served without a request.
+    An older one is revalidated with If-None-Match/If-Modified-Since from its
+    stored ETag/Last-Modified, and a 304 serves the body from disk; a 200
+    replaces the entry. Every use refreshes the entry's mtime, which orders
+    the least-recently-used eviction keeping the bodies under cache.max_bytes.
+
+    Args:
+        url (str): URL to fetch.
+        cache (HttpCache): The cache to use, or None to always GET.
+        headers (dict): Extra request headers (e.g. Authorization).
+
+    Returns:
+        The response: a requests.Response for anything not served from the
+        cache (callers check status_code as usual), else a _CachedResponse.
+    """
+    headers = dict(headers or {})
+    if cache is None:
+        return _http_get(url, headers=headers)
+    fresh = _http_cache_fresh(cache, url)
+    if fresh is not None:
+        return _CachedResponse(fresh)
+    meta, body = _http_cache_entry(cache, url)
+    body_path, meta_path = _http_cache_paths(cache, url)
+    if meta is not None and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta is not None and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    response = _http_get(url, headers=headers)
+    if response.status_code == 304 and meta is not None:
+        meta['fetched'] = time.time()
+        _write_atomic(meta_path, json.dumps(meta).encode())
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(body_path)
+        return _CachedResponse(body)
+    if response.status_code == 200:
+        _http_cache_store(cache, url, response.content,
+                          response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response
 
 def _multi_urljoin(*parts):
     return urljoin(parts[0], "/".join(quote_plus(part.strip("/"), safe="/") for part in parts[1:]))
 
-def _detect_pkg_comp_fmt(url_base, abi_arch, path):
+def _detect_pkg_comp_fmt(url_base, abi_arch, path, http_cache=None):
     meta_conf_url = _multi_urljoin(url_base, abi_arch.replace('-', ':'), path, "meta.conf")
-    response = requests.get(meta_conf_url)
+    with _phase(f'http {meta_conf_url}') as counters:
+        response = _cached_http_get(meta_conf_url, http_cache)
+        counters['files'] = 1
+        counters['bytes_in'] = len(response.content)
     if response.status_code != 200:
         raise ValueError(f"failed to fetch {meta_conf_url}: HTTP {response.status_code}")
     match = re.search(r'packing_format\s*=\s*"?([^"]+)"?', response.text)
@@ -819,46 +2285,173 @@ def _detect_pkg_comp_fmt(url_base, abi_arch, path):
         raise ValueError(f"no packing_format found in {meta_conf_url}")
     return match.group(1)
 
-def _extract_packagesite(pkgsite_data, compression_format):
-    if compression_format == "tzst":
-        with io.BytesIO(pkgsite_data) as f:
-            dctx = zstd.ZstdDecompressor()
-            with dctx.stream_reader(f) as s:
-                data = io.BytesIO(s.read())
-        with tarfile.open(fileobj=data, mode='r:') as tar:
-            content = tar.extractfile('packagesite.yaml').read()
-    else:
-        with tarfile.open(fileobj=io.BytesIO(pkgsite_data), mode=f'r:{compression_format[1:]}') as tar:
-            content = tar.extractfile('packagesite.yaml').read()
-    return [json.loads(line) for line in io.StringIO(content.decode()).readlines()]
+PACKAGESITE_FIELDS = ('name', 'version', 'sum', 'path')
+PACKAGESITE_KEYS = tuple((field, b'"%s":"' % field.encode()) for field in PACKAGESITE_FIELDS)
 
-def _load_packagesite(url_base, abi_arch, path):
+def _packagesite_record(line):
+    """
+    The PACKAGESITE_FIELDS of one packagesite line.
+
+    pkg writes compact JSON with the scalar fields (name, origin, version,
+    ..., sum, path) ahead of any nested object or array (licenses, deps,
+    shlibs, ...), so the fields are found with plain substring searches in
+    the part of the line before its first nested value; a dependency's
+    "version" further on is never looked at. A line that does not fit that
+    layout, or whose fields carry escapes, is handed to json.loads.
+    """
+    limit = len(line)
+    for opener in (b'":{', b'":['):
+        nested = line.find(opener, 0, limit)
+        if nested != -1:
+            limit = nested
+    record = {}
+    for field, key in PACKAGESITE_KEYS:
+        start = line.find(key, 0, limit)
+        end = line.find(b'"', start + len(key), limit) if start != -1 else -1
+        value = line[start + len(key):end]
+        if end == -1 or b'\\' in value:
+            package = json.loads(line)
+            return {k: package[k] for k in PACKAGESITE_FIELDS if k in package}
+        record[field] = value.decode()
+    return record
+
+class PackagesiteIndex:
+    """
+    An upstream packagesite, indexed by package name.
+
+    Each line is reduced to its PACKAGESITE_FIELDS while indexing (see
+    _packagesite_record), mostly without a full JSON parse, and dropped, so the index retains a few short
+    strings per package rather than the packagesite. The first line of a
+    name wins, as a scan would.
+    """
+
+    def __init__(self, lines):
+        self._packages = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            record = _packagesite_record(line)
+            if record.get('name') is not None and record['name'] not in self._packages:
+                self._packages[record['name']] = tuple(record.get(k) for k in PACKAGESITE_FIELDS[1:])
+
+    def __len__(self):
+        return len(self._packages)
+
+    def __contains__(self, name):
+        return name in self._packages
+
+    def get(self, name):
+        """The {name, version, sum, path} record of package name, or None if it is not listed."""
+        fields = self._packages.get(name)
+        if fields is None:
+            return None
+        return {'name': name, **{k: v for k, v in zip(PACKAGESITE_FIELDS[1:], fields) if v is not None}}
+
+# packing_format -> (leading magic bytes, tarfile stream mode); tzst goes through zstandard
+PACKING_FORMATS = {
+    'tzst': (ZSTD_MAGIC, None),
+    'txz': (b'\xfd7zXZ\x00', 'r|xz'),
+    'tgz': (b'\x1f\x8b', 'r|gz'),
+    'tbz': (b'BZh', 'r|bz2'),
+    'tar': (None, 'r|'),
+}
+
+def _sniff_packing_format(data):
+    """The packing_format of a packagesite archive from its first bytes, or None if unrecognised."""
+    for packing_format, (magic, _) in PACKING_FORMATS.items():
+        if magic is not None and data.startswith(magic):
+            return packing_format
+    if data[257:262] == b'ustar':
+        return 'tar'
+    return None
+
+def _index_packagesite(fobj, compression_format):
+    """
+    Stream an upstream packagesite archive into a PackagesiteIndex.
+
+    The packagesite.yaml member is decompressed and indexed line by line;
+    only the index's trimmed records outlive their line.
+
+    Args:
+        fobj: Binary file object positioned at the archive.
+        compression_format (str): A PACKING_FORMATS key (tzst, txz, tgz, tbz or tar).
+
+    Returns:
+        PackagesiteIndex: The packages of the packagesite, by name.
+    """
+    if compression_format not in PACKING_FORMATS:
+        raise ValueError(f"unsupported packagesite packing_format {compression_format!r}")
+    if compression_format == 'tzst':
+        tar = tarfile.open(fileobj=zstd.ZstdDecompressor().stream_reader(fobj), mode='r|')
+    else:
+        tar = tarfile.open(fileobj=fobj, mode=PACKING_FORMATS[compression_format][1])
+    with tar:
+        for member in tar:
+            if member.name.lstrip('./') == 'packagesite.yaml':
+                return PackagesiteIndex(tar.extractfile(member))
+    raise KeyError("no packagesite.yaml member")
+
+def _load_packagesite(url_base, abi_arch, path, http_cache=None):
+    """The PackagesiteIndex of an upstream repo, fetched once per process (and once across threads)."""
     domain = urlparse(url_base).netloc.replace('.', '-')
     key = f"{domain}-{abi_arch}-{path}"
-    if key in packagesite_cache:
-        return packagesite_cache[key]
+    with packagesite_cache_lock:
+        future = packagesite_cache.get(key)
+        fetching = future is None
+        if fetching:
+            future = packagesite_cache[key] = concurrent.futures.Future()
+    if not fetching:
+        return future.result()
+    try:
+        future.set_result(_fetch_packagesite(url_base, abi_arch, path, http_cache))
+    except BaseException as e:
+        with packagesite_cache_lock:
+            del packagesite_cache[key]  # a failed fetch is retried by the next load
+        future.set_exception(e)
+    return future.result()
+
+def _fetch_packagesite(url_base, abi_arch, path, http_cache=None):
     url = _multi_urljoin(url_base, abi_arch.replace('-', ':'), path, "packagesite.pkg")
-    response = requests.get(url)
+    with _phase(f'http {url}') as counters:
+        response = _cached_http_get(url, http_cache)
+        counters['files'] = 1
+        counters['bytes_in'] = len(response.content)
     if response.status_code != 200:
         raise ValueError(f"failed to download {url}: HTTP {response.status_code}")
-    compression_format = _detect_pkg_comp_fmt(url_base, abi_arch, path)
-    packagesite_cache[key] = _extract_packagesite(response.content, compression_format)
-    return packagesite_cache[key]
-
-def _bsd_latest_version(pkg_name, config, abi_arch):
-    url_base = config.get('redistribute', {}).get('repo', '')
-    path = config.get('redistribute', {}).get('path', '').split('/')[0]
-    for package in _load_packagesite(url_base, abi_arch, path):
-        if package.get('name') == pkg_name:
-            return package.get('version')
+    # the archive's magic bytes name its format; meta.conf is only asked when they do not
+    compression_format = (_sniff_packing_format(response.content)
+                          or _detect_pkg_comp_fmt(url_base, abi_arch, path, http_cache))
+    return _index_packagesite(io.BytesIO(response.content), compression_format)
+
+def _packagesite_version(packages, pkg_name, url_base):
+    package = packages.get(pkg_name)
+    if package is not None:
+        return package.get('version')
     raise ValueError(f"{pkg_name} not found in packagesite from {url_base}")
 
-def _gh_latest_version(src_repo, token=None):
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+
+def _gh_repo(src_repo):
+    """The owner/name of a GitHub repository URL."""
     match = re.search(r'https://github.com/([^/]+/[^/]+)', src_repo)
     if not match:
         raise ValueError(f"could not parse GitHub repository from {src_repo}")
+    return match.group(1)
+
+def _gh_latest_version(src_repo, token=None, http_cache=None):
+    """
+    The latest release version of a GitHub repository, over REST.
+
+    With an http_cache the request is conditional on the stored ETag; an
+    unchanged release costs a 304, which GitHub does not count against the
+    rate limit.
+    """
     headers = {'Authorization': f'token {token}'} if token else {}
-    response = requests.get(f"https://api.github.com/repos/{match.group(1)}/releases/latest", headers=headers)
+    url = f"https://api.github.com/repos/{_gh_repo(src_repo)}/releases/latest"
+    with _phase(f'http {url}') as counters:
+        response = _cached_http_get(url, http_cache, headers)
+        counters['files'] = 1
+        counters['bytes_in'] = len(response.content)
     if response.status_code != 200:
         raise ValueError(f"failed to get release info from GitHub API: HTTP {response.status_code}")
     remote_version = str(response.json().get('tag_name', '')).lstrip('v')
@@ -866,58 +2459,204 @@ def _gh_latest_version(src_repo, token=None):
         raise ValueError(f"no release found for {src_repo}")
     return remote_version
 
-def check_updates(pkgs_dir='pkgs'):
+def _gh_latest_versions(src_repos, token, http_cache=None):
+    """
+    The latest release versions of many GitHub repositories in one GraphQL query.
+
+    Each repository is an aliased repository(owner, name) { latestRelease }
+    field, so the whole set costs a single request. Versions resolved within
+    http_cache.max_age are reused from the cache instead of being queried,
+    and fresh results are stored there.
+
+    Args:
+        src_repos (list): GitHub repository URLs.
+        token (str): GitHub token; the GraphQL API requires one.
+        http_cache (HttpCache): Cache shared with the other update lookups, or None.
+
+    Returns:
+        dict: {src_repo: version, or the ValueError its lookup failed with}.
+    """
+    results, pending = {}, {}
+    for src_repo in src_repos:
+        try:
+            repo = _gh_repo(src_repo)
+        except ValueError as e:
+            results[src_repo] = e
+            continue
+        fresh = _http_cache_fresh(http_cache, f'{GITHUB_GRAPHQL_URL}#{repo}') if http_cache else None
+        if fresh is not None:
+            results[src_repo] = fresh.decode()
+        else:
+            pending[src_repo] = repo
+    if not pending:
+        return results
+
+    fields, variables = [], {}
+    for i, repo in enumerate(pending.values()):
+        variables[f'owner{i}'], variables[f'name{i}'] = repo.split('/')
+        fields.append(f'r{i}: repository(owner: $owner{i}, name: $name{i}) {{ latestRelease {{ tagName }} }}')
+    params = ', '.join(f'$owner{i}: String!, $name{i}: String!' for i in range(len(pending)))
+    query = f"query({params}) {{ {' '.join(fields)} }}"
+    with _phase(f'http {GITHUB_GRAPHQL_URL}') as counters:
+        response = _http_request('POST', GITHUB_GRAPHQL_URL, json={'query': query, 'variables': variables},
+                                 headers={'Authorization': f'bearer {token}'})
+        counters['files'] = 1
+        counters['bytes_in'] = len(response.content)
+    if response.status_code != 200:
+        error = ValueError(f"failed to get release info from GitHub GraphQL API: HTTP {response.status_code}")
+        return {**results, **dict.fromkeys(pending, error)}
+
+    try:
+        body = response.json()
+        if not isinstance(body, dict):
+            raise ValueError(f"expected an object, got {type(body).__name__}")
+    except ValueError as e:  # requests' JSONDecodeError is a ValueError
+        error = ValueError(f"malformed answer from GitHub GraphQL API: {e}")
+        return {**results, **dict.fromkeys(pending, error)}
+    data = body.get('data') or {}
+    errors = {err['path'][0]: err.get('message', '') for err in body.get('errors') or [] if err.get('path')}
+    for i, (src_repo, repo) in enumerate(pending.items()):
+        release = (data.get(f'r{i}') or {}).get('latestRelease') or {}
+        version = str(release.get('tagName') or '').lstrip('v')
+        if f'r{i}' in errors:
+            results[src_repo] = ValueError(f"failed to get release info for {src_repo}: {errors[f'r{i}']}")
+        elif not version:
+            results[src_repo] = ValueError(f"no release found for {src_repo}")
+        else:
+            results[src_repo] = version
+            if http_cache:
+                _http_cache_store(http_cache, f'{GITHUB_GRAPHQL_URL}#{repo}', version.encode())
+    return results
+
+def _update_checks(config):
+    """
+    The version comparisons of a spec's update check.
+
+    Returns:
+        list: (abi_arch, source, local version) per matrix row the spec can
+        emit. source is the remote lookup it compares against: ('github',
+        repo URL) or ('packagesite', repo, abi_arch, path).
+    """
+    if config.get('content'):
+        # Bundled content (e.g. the Homer dashboard inside os-homer)
+        # follows the upstream repo releases — checked even though the
+        # spec is a plugin. The 'content' abi_arch routes bump to the
+        # content.version line and rev-bumps the plugin package version.
+        return [('content', ('github', config['content']['repo']), str(config['content']['version']))]
+    if config.get('plugin'):
+        return []
+    if config.get('redistribute'):
+        dep = config['redistribute']
+        return [(abi_arch, ('packagesite', dep.get('repo', ''), abi_arch, dep.get('path', '').split('/')[0]),
+                 str(local)) for abi_arch, local in dep['version'].items()]
+    src_repo = config.get('build_config', {}).get('src_repo', '')
+    if 'github.com' not in src_repo:
+        return []  # static asset packages (e.g. the shared editor) have no remote version source
+    # A FreeBSD revision suffix (_N) marks package-only changes and is
+    # not a version difference — strip it before comparing, mirroring
+    # the guard in pkgs/*/build.sh.
+    local = str(config.get('pkg_manifest', {}).get('version'))
+    return [('ALL', ('github', src_repo), re.sub(r'_[0-9]+$', '', local))]
+
+def _fetch_update_source(source, token, http_cache=None):
+    """Run one remote lookup: a GitHub release version, or an upstream packagesite's packages."""
+    if source[0] == 'github':
+        return _gh_latest_version(source[1], token, http_cache)
+    return _load_packagesite(*source[1:], http_cache=http_cache)
+
+def _lookup(lookups, source):
+    """The result of a gathered lookup, raising the error it failed with."""
+    result = lookups[source]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def check_updates(pkgs_dir='pkgs', concurrency=HTTP_CONCURRENCY, http_cache=None,
+                  http_cache_max_age=HTTP_CACHE_MAX_AGE, http_cache_max_bytes=HTTP_CACHE_MAX_BYTES):
     """
     Check all package specs for newer versions.
 
     Returns the update matrix: {'pkg': [...], 'include': [{pkg, abi_arch, version}, ...]}.
     Sources are adapters: FreeBSD packagesite (redistribute specs) and GitHub
     releases (build specs with a src_repo).
+
+    All remote lookups are gathered first and run concurrently (each distinct
+    release or packagesite once, over pooled per-host sessions), so the check
+    takes as long as its slowest source. With $GITHUB_TOKEN set, every GitHub
+    release is resolved by one GraphQL query; without it each goes over REST.
+    The matrix is then assembled in spec order exactly as a sequential walk
+    would. Remote calls retry transient failures and respect rate limits
+    (see _http_request); a lookup that still fails only drops its own rows,
+    which are listed under an extra 'errors' key ([{pkg, abi_arch, error}]).
+    Only when every check fails is the run an error.
+
+    With http_cache set, upstream packagesites, their meta.conf and GitHub
+    releases go through an on-disk conditional-request cache in that
+    directory: entries younger than http_cache_max_age seconds are reused as
+    they are, older ones are revalidated, and an unchanged packagesite costs
+    one 304 instead of a multi-megabyte download. The cache is kept under
+    http_cache_max_bytes.
     """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    if http_cache_max_age < 0:
+        raise ValueError(f"http_cache_max_age must not be negative, got {http_cache_max_age}")
+    cache = HttpCache(http_cache, http_cache_max_age, http_cache_max_bytes) if http_cache else None
+    specs = [(config_file.parent.name, _load_spec(config_file))
+             for config_file in sorted(Path(pkgs_dir).glob('*/config.yml'))]
+    sources = list(dict.fromkeys(source for _, config in specs for _, source, _ in _update_checks(config)))
+    token = os.environ.get('GITHUB_TOKEN')
+    batched = [source for source in sources if token and source[0] == 'github']
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(sources)))) as pool:
+        futures = {source: pool.submit(_fetch_update_source, source, token, cache)
+                   for source in sources if source not in batched}
+        releases = pool.submit(_gh_latest_versions, [source[1] for source in batched], token, cache)
+    lookups = {source: future.exception() or future.result() for source, future in futures.items()}
+    lookups.update({('github', src_repo): result for src_repo, result in releases.result().items()})
+
     matrix = {'pkg': [], 'include': []}
-    for config_file in sorted(Path(pkgs_dir).glob('*/config.yml')):
-        pkg_name = config_file.parent.name
-        config = _load_spec(config_file)
-        if config.get('content'):
-            # Bundled content (e.g. the Homer dashboard inside os-homer)
-            # follows the upstream repo releases — checked even though the
-            # spec is a plugin. The 'content' abi_arch routes bump to the
-            # content.version line and rev-bumps the plugin package version.
-            remote = _gh_latest_version(config['content']['repo'], os.environ.get('GITHUB_TOKEN'))
-            local = str(config['content']['version'])
+    errors = []
+    for pkg_name, config in specs:
+        for abi_arch, source, local in _update_checks(config):
+            try:
+                remote = _lookup(lookups, source)
+                if source[0] == 'packagesite':
+                    remote = _packagesite_version(remote, pkg_name, source[1])
+            except (ValueError, KeyError, requests.RequestException, tarfile.TarError, zstd.ZstdError) as e:
+                # one broken upstream only costs its own rows
+                errors.append({'pkg': pkg_name, 'abi_arch': abi_arch, 'error': str(e)})
+                continue
             if str(remote) != local:
                 matrix['pkg'].append(pkg_name)
-                matrix['include'].append({'pkg': pkg_name, 'abi_arch': 'content', 'version': remote})
-            continue
-        if config.get('plugin'):
-            continue
-        if config.get('redistribute'):
-            for abi_arch, local in config['redistribute']['version'].items():
-                remote = _bsd_latest_version(pkg_name, config, abi_arch)
-                if str(remote) != str(local):
-                    matrix['pkg'].append(pkg_name)
-                    matrix['include'].append({'pkg': pkg_name, 'abi_arch': abi_arch, 'version': remote})
-        else:
-            src_repo = config.get('build_config', {}).get('src_repo', '')
-            local = str(config.get('pkg_manifest', {}).get('version'))
-            if 'github.com' in src_repo:
-                remote = _gh_latest_version(src_repo, os.environ.get('GITHUB_TOKEN'))
-            else:
-                continue  # static asset packages (e.g. the shared editor) have no remote version source
-            # A FreeBSD revision suffix (_N) marks package-only changes and is
-            # not a version difference — strip it before comparing, mirroring
-            # the guard in pkgs/*/build.sh.
-            local_base = re.sub(r'_[0-9]+$', '', local)
-            if str(remote) != local_base:
-                matrix['pkg'].append(pkg_name)
-                matrix['include'].append({'pkg': pkg_name, 'abi_arch': 'ALL', 'version': remote})
+                matrix['include'].append({'pkg': pkg_name, 'abi_arch': abi_arch, 'version': remote})
+    if errors:
+        checks = sum(len(_update_checks(config)) for _, config in specs)
+        if len(errors) == checks:
+            raise ValueError(f"all {checks} update checks failed, first: {errors[0]['pkg']}: {errors[0]['error']}")
+        matrix['errors'] = errors
     return matrix
 
+def _add_compression_arguments(parser, config_key):
+    parser.add_argument('--zstd-level', required=False, type=int, default=None,
+                        help=f'zstd compression level, 1-{zstd.MAX_COMPRESSION_LEVEL} (default: {config_key} or 3)')
+    parser.add_argument('--zstd-threads', required=False, type=int, default=None,
+                        help=f'zstd worker threads, -1 for all CPUs (default: {config_key} or 0)')
+    parser.add_argument('--zstd-long', required=False, action=argparse.BooleanOptionalAction, default=None,
+                        help=f'zstd long-distance matching (default: {config_key} or off)')
+
+def _compression_arguments(args):
+    compression = {'level': args.zstd_level, 'threads': args.zstd_threads, 'long': args.zstd_long}
+    _validate_compression({k: v for k, v in compression.items() if v is not None}, 'command line', 'zstd')
+    return compression
+
 def main():
     """
     Main function to parse command-line arguments and execute corresponding functions.
     """
     parser = argparse.ArgumentParser(description='FreeBSD Custom Package Repository CLI')
+    parser.add_argument('--profile', required=False, default=os.environ.get('PKG_TOOL_PROFILE') or None,
+                        help='Write a JSON report of per-phase wall/CPU time, bytes and file counts to this path '
+                             '(default: $PKG_TOOL_PROFILE, else disabled)')
     subparsers = parser.add_subparsers(dest='command')
 
     parser_pack = subparsers.add_parser('pack', help='Pack a staged payload into a FreeBSD package')
@@ -928,6 +2667,36 @@ def main():
                              help='Directory containing the staged payload (default: pkg)')
     parser_pack.add_argument('--output-dir', required=False, default='.',
                              help='Directory to output the package (default: current directory)')
+    parser_pack.add_argument('--jobs', required=False, type=int, default=None,
+                             help='Worker threads for hashing the payload (default: CPU count)')
+    _add_compression_arguments(parser_pack, 'build_config.compression')
+    parser_pack.add_argument('--digest-cache', required=False, default=None,
+                             help='Cache file for payload digests across runs (default: disabled)')
+    parser_pack.add_argument('--digest-cache-entries', required=False, type=int, default=DIGEST_CACHE_MAX_ENTRIES,
+                             help=f'Maximum digest cache entries, least recently used dropped first '
+                                  f'(default: {DIGEST_CACHE_MAX_ENTRIES})')
+    parser_pack.add_argument('--output-cache', required=False, default=None,
+                             help='Directory of packed artifacts reused when spec, ABI/arch and payload are '
+                                  'unchanged (default: disabled)')
+    parser_pack.add_argument('--output-cache-max-bytes', required=False, type=int, default=OUTPUT_CACHE_MAX_BYTES,
+                             help=f'Maximum output cache size, least recently used entries evicted first '
+                                  f'(default: {OUTPUT_CACHE_MAX_BYTES})')
+
+    parser_pack_batch = subparsers.add_parser('pack-batch', help='Pack many staged payloads concurrently')
+    parser_pack_batch.add_argument('jobs_file', nargs='?', default='-',
+                                   help='JSON list of {config, abi, arch, payload_dir, output_dir} jobs '
+                                        '(default: - for stdin)')
+    parser_pack_batch.add_argument('--jobs', required=False, type=int, default=None,
+                                   help='Worker processes (default: CPU count)')
+    _add_compression_arguments(parser_pack_batch, 'build_config.compression')
+    parser_pack_batch.add_argument('--digest-cache', required=False, default=None,
+                                   help='Cache file for payload digests across runs (default: disabled)')
+    parser_pack_batch.add_argument('--digest-cache-entries', required=False, type=int, default=DIGEST_CACHE_MAX_ENTRIES,
+                                   help=f'Maximum digest cache entries (default: {DIGEST_CACHE_MAX_ENTRIES})')
+    parser_pack_batch.add_argument('--output-cache', required=False, default=None,
+                                   help='Directory of packed artifacts reused for unchanged inputs (default: disabled)')
+    parser_pack_batch.add_argument('--output-cache-max-bytes', required=False, type=int, default=OUTPUT_CACHE_MAX_BYTES,
+                                   help=f'Maximum output cache size (default: {OUTPUT_CACHE_MAX_BYTES})')
 
     parser_redistribute_pkg = subparsers.add_parser('redistribute-pkg', help='Redistribute package')
     parser_redistribute_pkg.add_argument('config_path', help='Path to the config.yml file')
@@ -935,6 +2704,21 @@ def main():
     parser_redistribute_pkg.add_argument('--arch', required=True, help='Architecture')
     parser_redistribute_pkg.add_argument('--output-dir', required=False, default='.',
                                          help='Directory to output the package & packagesite info file  (default: current directory)')
+    parser_redistribute_pkg.add_argument('--cache-dir', required=False, default=None,
+                                         help='Cache of upstream packages keyed and verified by their upstream '
+                                              'packagesite sum (default: disabled)')
+
+    parser_redistribute_all = subparsers.add_parser(
+        'redistribute-all', help='Redistribute every redistribute spec concurrently')
+    parser_redistribute_all.add_argument('--pkgs-dir', required=False, default='pkgs',
+                                         help='Directory containing the package specs (default: pkgs)')
+    parser_redistribute_all.add_argument('--output-dir', required=False, default='dist',
+                                         help='Directory to output one <pkg>/<abi-arch> dir per package (default: dist)')
+    parser_redistribute_all.add_argument('--concurrency', required=False, type=int, default=REDISTRIBUTE_CONCURRENCY,
+                                         help=f'Maximum concurrent downloads (default: {REDISTRIBUTE_CONCURRENCY})')
+    parser_redistribute_all.add_argument('--cache-dir', required=False, default=None,
+                                         help='Cache of upstream packages keyed and verified by their upstream '
+                                              'packagesite sum (default: disabled)')
 
     parser_assemble_repo = subparsers.add_parser('assemble-repo', help='Assemble the published repo tree from built packages')
     parser_assemble_repo.add_argument('artifacts_dir', help='Directory containing .pkg files and their packagesite_info.json')
@@ -943,10 +2727,36 @@ def main():
     parser_assemble_repo.add_argument('--repo', required=True, help='GitHub repo name (used in the opnware.conf URL)')
     parser_assemble_repo.add_argument('--output-dir', required=False, default='pages',
                                       help='Directory to output the repo tree (default: pages)')
+    _add_compression_arguments(parser_assemble_repo, 'pkg-repo.compression')
+    parser_assemble_repo.add_argument('--placement', required=False, choices=PLACEMENTS, default='copy',
+                                      help='How packages are placed into the tree; hardlink and reflink fall back '
+                                           'to copying across filesystems, symlink links the extra arch slots of '
+                                           'arch-independent packages to their first copy (default: copy)')
+    parser_assemble_repo.add_argument('--jobs', required=False, type=int, default=None,
+                                      help='Worker processes assembling the ABI/arch slots (default: CPU count)')
+    parser_assemble_repo.add_argument('--index-json', action='store_true',
+                                      help='Also write a machine-readable index.json into every directory')
+    parser_assemble_repo.add_argument('--incremental', action='store_true',
+                                      help='Update the tree already in the output dir: artifacts replace the '
+                                           'published packages of the same name, everything else is kept')
 
     parser_check_updates = subparsers.add_parser('check-updates', help='Check all package specs for newer versions')
     parser_check_updates.add_argument('--pkgs-dir', required=False, default='pkgs',
                                       help='Directory containing the package specs (default: pkgs)')
+    parser_check_updates.add_argument('--concurrency', required=False, type=int, default=HTTP_CONCURRENCY,
+                                      help=f'Maximum concurrent remote lookups (default: {HTTP_CONCURRENCY})')
+    parser_check_updates.add_argument('--http-cache', required=False, default=None,
+                                      help='Directory caching upstream packagesites and GitHub releases between runs, revalidated '
+                                           'with ETag/Last-Modified (default: disabled)')
+    parser_check_updates.add_argument('--http-cache-max-age', required=False, type=int, default=HTTP_CACHE_MAX_AGE,
+                                      help=f'Seconds a cached packagesite is reused without revalidating '
+                                           f'(default: {HTTP_CACHE_MAX_AGE}, always revalidate)')
+    parser_check_updates.add_argument('--http-cache-max-bytes', required=False, type=int, default=HTTP_CACHE_MAX_BYTES,
+                                      help=f'Size bound of the HTTP cache, least recently used dropped first '
+                                           f'(default: {HTTP_CACHE_MAX_BYTES})')
+    parser_check_updates.add_argument('--errors-file', required=False, default=None,
+                                      help='Write the failed update checks as a JSON list of {pkg, abi_arch, error} '
+                                           'to this path, [] when all succeeded (default: only logged)')
 
     parser_bump = subparsers.add_parser('bump', help='Write a version back into a package spec')
     parser_bump.add_argument('pkg', help='Package name (a directory under pkgs/)')
@@ -963,15 +2773,47 @@ def main():
 
     args = parser.parse_args()
 
+    global profile_phases
+    if args.profile:
+        profile_phases = []
+    wall, cpu = time.perf_counter(), time.process_time()
     try:
         if args.command == 'pack':
-            pack(args.config_path, args.abi, args.arch, args.payload_dir, args.output_dir)
+            pack(args.config_path, args.abi, args.arch, args.payload_dir, args.output_dir, args.jobs,
+                 _compression_arguments(args), args.digest_cache, args.digest_cache_entries, args.output_cache,
+                 args.output_cache_max_bytes)
+        elif args.command == 'pack-batch':
+            results = pack_batch(_load_batch_jobs(args.jobs_file), args.jobs, _compression_arguments(args),
+                                 args.digest_cache, args.digest_cache_entries, args.output_cache,
+                                 args.output_cache_max_bytes)
+            print(json.dumps(results, indent=2))
+            failed = [r for r in results if r['status'] != 'ok']
+            if failed:
+                raise ValueError(f"{len(failed)} of {len(results)} pack-batch jobs failed")
         elif args.command == 'redistribute-pkg':
-            redistribute_pkg(args.config_path, args.abi, args.arch, args.output_dir)
+            redistribute_pkg(args.config_path, args.abi, args.arch, args.output_dir, args.cache_dir)
+        elif args.command == 'redistribute-all':
+            results = redistribute_all(args.pkgs_dir, args.output_dir, args.concurrency, args.cache_dir)
+            print(json.dumps(results, indent=2))
+            failed = [r for r in results if r['status'] != 'ok']
+            if failed:
+                raise ValueError(f"{len(failed)} of {len(results)} redistributions failed")
         elif args.command == 'assemble-repo':
-            assemble_repo(args.artifacts_dir, args.repo_config, args.owner, args.repo, args.output_dir)
+            assemble_repo(args.artifacts_dir, args.repo_config, args.owner, args.repo, args.output_dir,
+                          _compression_arguments(args), args.placement, args.incremental, args.jobs,
+                          args.index_json)
         elif args.command == 'check-updates':
-            matrix = check_updates(args.pkgs_dir)
+            matrix = check_updates(args.pkgs_dir, args.concurrency, args.http_cache,
+                                   args.http_cache_max_age, args.http_cache_max_bytes)
+            # errors stay out of stdout, which feeds a workflow job matrix as is;
+            # a partial run still exits 0 so its updates go ahead, and the
+            # errors file is what tells it apart from a clean one
+            errors = matrix.pop('errors', [])
+            for error in errors:
+                logging.getLogger(__name__).error(f"{error['pkg']} ({error['abi_arch']}): {error['error']}")
+            if args.errors_file:
+                with open(args.errors_file, 'w') as f:
+                    json.dump(errors, f, indent=2)
             if matrix['pkg']:
                 print(json.dumps(matrix))
         elif args.command == 'bump':
@@ -985,6 +2827,11 @@ def main():
     except (TypeError, ValueError, FileNotFoundError, KeyError) as e:
         logging.getLogger(__name__).error(str(e))
         sys.exit(1)
+    finally:
+        # failed runs are reported too: where a broken CI job spent its time matters most
+        if args.profile:
+            _write_profile(args.profile, args.command, profile_phases,
+                           time.perf_counter() - wall, time.process_time() - cpu)
 
 if __name__ == '__main__':
     main()
@@ -12,6 +12,7 @@ import tarfile
 import pytest
 import zstandard as zstd
 
+import pkg_tool
 from pkg_tool import assemble_repo, pack
 from test_pack import SPEC, PLUGIN_SPEC, make_fixture, make_plugin_fixture
 
@@ -112,6 +113,178 @@ def test_assemble_repo_accepts_arch_independent_meta_package(tmp_path):
     assert line["name"] == "go"
 
 
+@pytest.mark.parametrize("placement", ["hardlink", "symlink"])
+def test_assemble_repo_places_arch_independent_package_once(tmp_path, placement):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    pkg = make_artifact(str(artifacts), "go", abi_arch="FreeBSD:15:*")
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG.replace("    - amd64\n", "    - aarch64\n    - amd64\n"))
+    pages = tmp_path / "pages"
+
+    for _ in range(2):  # reruns replace the placed files, never write through them
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), placement=placement)
+
+    first = pages / "FreeBSD:15:aarch64" / "latest" / "All" / "go.pkg"
+    other = pages / "FreeBSD:15:amd64" / "latest" / "All" / "go.pkg"
+    assert os.path.samefile(first, pkg)
+    if placement == "symlink":
+        assert os.readlink(other) == "../../../FreeBSD:15:aarch64/latest/All/go.pkg"
+    else:
+        assert os.path.samefile(other, pkg)
+    assert other.read_bytes() == b"fake-pkg-bytes"
+
+
+def test_assemble_repo_placement_falls_back_to_copy(tmp_path, monkeypatch):
+    def cross_device(*args):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    monkeypatch.setattr(pkg_tool, "_reflink", cross_device)
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    pkg = make_artifact(str(artifacts), "go")
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG)
+    pages = tmp_path / "pages"
+
+    assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), placement="hardlink")
+
+    placed = pages / "FreeBSD:15:amd64" / "latest" / "All" / "go.pkg"
+    assert placed.read_bytes() == b"fake-pkg-bytes"
+    assert not os.path.samefile(placed, pkg)
+    with pytest.raises(ValueError, match="unknown placement"):
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), placement="move")
+
+
+def test_assemble_repo_incremental_replaces_only_changed_packages(tmp_path):
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG)
+    pages = tmp_path / "pages"
+    full = tmp_path / "full"
+    full.mkdir()
+    make_artifact(str(full), "go-1.0", extra={"name": "go", "path": "All/go-1.0.pkg"})
+    make_artifact(str(full), "zsh-5.9", extra={"name": "zsh", "path": "All/zsh-5.9.pkg"})
+    assemble_repo(str(full), str(config), owner="o", repo="r", output_dir=str(pages))
+
+    changed = tmp_path / "changed"
+    changed.mkdir()
+    make_artifact(str(changed), "go-1.1", extra={"name": "go", "path": "All/go-1.1.pkg"})
+    assemble_repo(str(changed), str(config), owner="o", repo="r", output_dir=str(pages), incremental=True)
+
+    latest = pages / "FreeBSD:15:amd64" / "latest"
+    assert sorted(os.listdir(latest / "All")) == ["go-1.1.pkg", "index.html", "zsh-5.9.pkg"]
+    content = read_tzst(str(latest / "packagesite.tzst"))
+    lines = [json.loads(line) for line in content["packagesite.yaml"].decode().splitlines()]
+    assert [(line["name"], line["path"]) for line in lines] == [("zsh", "All/zsh-5.9.pkg"), ("go", "All/go-1.1.pkg")]
+    assert (latest / "meta.conf").exists()
+    assert "go-1.1.pkg" in (latest / "All" / "index.html").read_text()
+
+
+MULTI_SLOT_CONFIG = REPO_CONFIG.replace("    - 15\n", "    - 14\n    - 15\n").replace(
+    "    - amd64\n", "    - aarch64\n    - amd64\n")
+
+
+def test_assemble_repo_slots_in_parallel_match_sequential(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "go", abi_arch="FreeBSD:14:*")
+    make_artifact(str(artifacts), "zsh", abi_arch="FreeBSD:15:aarch64")
+    make_artifact(str(artifacts), "htop", abi_arch="FreeBSD:15:amd64")
+    config = tmp_path / "config.yml"
+    config.write_text(MULTI_SLOT_CONFIG)
+
+    trees = []
+    for workers in (1, 4):
+        pages = tmp_path / f"pages-{workers}"
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), workers=workers)
+        slots = sorted(d for d in os.listdir(pages) if d.startswith("FreeBSD:"))
+        trees.append({slot: (sorted(os.listdir(pages / slot / "latest" / "All")),
+                             (pages / slot / "latest" / "packagesite.tzst").read_bytes()) for slot in slots})
+    assert list(trees[0]) == ["FreeBSD:14:aarch64", "FreeBSD:14:amd64", "FreeBSD:15:aarch64", "FreeBSD:15:amd64"]
+    assert trees[0] == trees[1]
+
+
+def test_assemble_repo_reports_every_failing_slot(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "go", abi_arch="FreeBSD:14:*")
+    make_artifact(str(artifacts), "htop", abi_arch="FreeBSD:15:amd64")
+    config = tmp_path / "config.yml"
+    config.write_text(MULTI_SLOT_CONFIG)
+    pages = tmp_path / "pages"
+    for slot in ("FreeBSD:14:aarch64", "FreeBSD:15:amd64"):
+        (pages / slot).mkdir(parents=True)
+        (pages / slot / "latest").write_text("not a directory")
+
+    with pytest.raises(ValueError, match="2 of 3 repo slots failed") as excinfo:
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), workers=2)
+    assert "FreeBSD:14:aarch64: " in str(excinfo.value)
+    assert "FreeBSD:15:amd64: " in str(excinfo.value)
+    assert (pages / "FreeBSD:14:amd64" / "latest" / "packagesite.tzst").exists()
+
+
+def test_assemble_repo_propagates_programming_errors_from_a_slot(tmp_path, monkeypatch):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "htop", abi_arch="FreeBSD:15:amd64")
+    config = tmp_path / "config.yml"
+    config.write_text(MULTI_SLOT_CONFIG)
+
+    def broken_slot(*args):
+        raise TypeError("bug in the slot code")
+
+    monkeypatch.setattr(pkg_tool, "_assemble_slot", broken_slot)
+    with pytest.raises(TypeError, match="bug in the slot code"):
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(tmp_path / "pages"), workers=1)
+
+
+def test_index_tree_rewrites_only_changed_pages(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "zsh")
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG)
+    pages = tmp_path / "pages"
+    assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages), index_json=True)
+
+    all_dir = pages / "FreeBSD:15:amd64" / "latest" / "All"
+    listing = json.loads((all_dir / "index.json").read_text())
+    assert listing["path"] == "/FreeBSD:15:amd64/latest/All"
+    assert [(f["name"], f["size"]) for f in listing["files"]] == [("zsh.pkg", len(b"fake-pkg-bytes"))]
+    assert "href='index.html'" not in (all_dir / "index.html").read_text()
+
+    assert pkg_tool._generate_index_tree(str(pages), index_json=True) == 0
+    (all_dir / "extra.pkg").write_bytes(b"x")
+    # the All/ page and its json change, and so does latest/ whose listing shows All/'s ctime
+    assert pkg_tool._generate_index_tree(str(pages), index_json=True) >= 2
+    assert "extra.pkg" in (all_dir / "index.html").read_text()
+
+
+def test_assemble_repo_emits_data_catalogue_when_configured(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "go", extra={"path": "All/go.pkg"})
+    make_artifact(str(artifacts), "zsh", extra={"path": "All/zsh.pkg"})
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG + "  data: data\n")
+    pages = tmp_path / "pages"
+
+    assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages))
+
+    latest = pages / "FreeBSD:15:amd64" / "latest"
+    assert os.readlink(latest / "data.pkg") == "./data.tzst"
+    catalogue = json.loads(read_tzst(str(latest / "data.tzst"))["data"])
+    packagesite = read_tzst(str(latest / "packagesite.tzst"))["packagesite.yaml"].decode().splitlines()
+    assert catalogue["packages"] == [json.loads(line) for line in packagesite]
+    assert json.loads((latest / "meta.conf").read_text())["data"] == "data"
+    assert not (latest / "data").exists()
+
+    config.write_text(REPO_CONFIG + "  data: ../data\n")
+    with pytest.raises(TypeError, match="meta-conf.data"):
+        assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages))
+
+
 def test_assemble_repo_rejects_undeclared_abi(tmp_path):
     artifacts = tmp_path / "artifacts"
     artifacts.mkdir()
@@ -143,6 +316,31 @@ def test_assemble_repo_reads_abi_from_pkg_when_no_sibling_json(tmp_path):
     assert line["path"] == "All/blocky-0.34.0.pkg"
 
 
+def test_read_packagesite_info_streams_only_the_leading_manifest(tmp_path):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+    pkg = os.path.join(dist, "blocky-0.34.0.pkg")
+    with open(pkg, "rb") as f:
+        data = f.read()
+    # a package cut off after its first block still yields the manifest:
+    # the payload is never decompressed
+    truncated = tmp_path / "truncated.pkg"
+    truncated.write_bytes(zstd.ZstdCompressor().compress(
+        zstd.ZstdDecompressor().stream_reader(io.BytesIO(data)).read(2048)))
+    assert pkg_tool._read_packagesite_info(str(truncated))["name"] == "blocky"
+
+    # upstream xz/gzip packages, with the manifest not as the first member
+    manifest = json.dumps({"name": "upstream", "abi": "FreeBSD:15:amd64"}).encode()
+    for mode in ("w:xz", "w:gz"):
+        upstream = tmp_path / f"upstream-{mode[2:]}.pkg"
+        with tarfile.open(upstream, mode) as tar:
+            for name, body in (("+MANIFEST", b"{}"), ("+COMPACT_MANIFEST", manifest)):
+                info = tarfile.TarInfo(name)
+                info.size = len(body)
+                tar.addfile(info, io.BytesIO(body))
+        assert pkg_tool._read_packagesite_info(str(upstream))["name"] == "upstream"
+
+
 def test_assemble_repo_indexes_plugin_package(tmp_path):
     config, payload, dist = make_plugin_fixture(tmp_path)
     pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
@@ -207,3 +405,20 @@ def test_assemble_repo_fails_when_no_packages(tmp_path):
 
     with pytest.raises(ValueError, match="No .pkg"):
         assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(tmp_path / "pages"))
+
+
+def test_assemble_repo_applies_repo_compression_settings(tmp_path):
+    artifacts = tmp_path / "artifacts"
+    artifacts.mkdir()
+    make_artifact(str(artifacts), "alpha")
+    config = tmp_path / "config.yml"
+    config.write_text(REPO_CONFIG.replace("    - amd64\n", "    - amd64\n  compression:\n    level: 19\n    long: true\n"))
+    pages = tmp_path / "pages"
+
+    assemble_repo(str(artifacts), str(config), owner="o", repo="r", output_dir=str(pages))
+
+    latest = pages / "FreeBSD:15:amd64" / "latest"
+    members = read_tzst(str(latest / "packagesite.tzst"))
+    assert json.loads(members["packagesite.yaml"].decode())["name"] == "alpha"
+    # pkg-tool's own settings never leak into the meta.conf pkg reads
+    assert "compression" not in json.loads((latest / "meta.conf").read_text())
@@ -5,10 +5,13 @@ update matrix. Network is stubbed via monkeypatched requests."""
 import io
 import json
 import tarfile
+import threading
 
+import pytest
 import requests
 import zstandard as zstd
 
+import pkg_tool
 from pkg_tool import check_updates
 
 GH_SPEC = """\
@@ -62,25 +65,33 @@ pkg_manifest:
 
 
 class FakeResponse:
-    def __init__(self, status_code=200, text="", content=b"", json_data=None):
+    def __init__(self, status_code=200, text="", content=b"", json_data=None, headers=None):
         self.status_code = status_code
         self.text = text
-        self.content = content
+        self.content = content or text.encode()
         self._json = json_data
+        self.headers = headers or {}
 
     def json(self):
         return self._json
 
 
-def tzst_bytes(entries):
-    """A zstd tar containing packagesite.yaml with one JSON line per entry."""
+def tzst_bytes(entries, compression="zst"):
+    """A zstd tar (or a tarfile-compressed one) containing packagesite.yaml with one JSON line per entry."""
     raw = "".join(json.dumps(e) + "\n" for e in entries).encode()
     data = io.BytesIO()
-    with tarfile.open(fileobj=data, mode="w", format=tarfile.PAX_FORMAT) as tar:
+    mode = "w" if compression == "zst" else f"w:{compression}"
+    with tarfile.open(fileobj=data, mode=mode, format=tarfile.PAX_FORMAT) as tar:
         info = tarfile.TarInfo("packagesite.yaml")
         info.size = len(raw)
         tar.addfile(info, io.BytesIO(raw))
-    return zstd.ZstdCompressor().compress(data.getvalue())
+    return zstd.ZstdCompressor().compress(data.getvalue()) if compression == "zst" else data.getvalue()
+
+
+def stub_http(monkeypatch, fake_get):
+    """Route the pooled per-host sessions' GETs to fake_get(url, **kwargs) (REST lookups: no token)."""
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    monkeypatch.setattr(requests.Session, "get", lambda self, url, **kwargs: fake_get(url, **kwargs))
 
 
 def make_repo(tmp_path, specs):
@@ -98,7 +109,7 @@ def test_gh_adapter_detects_newer_version(tmp_path, monkeypatch):
         assert "api.github.com" in url
         return FakeResponse(json_data={"tag_name": "v0.36.0"})
 
-    monkeypatch.setattr(requests, "get", fake_get)
+    stub_http(monkeypatch, fake_get)
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
     assert matrix["pkg"] == ["blocky"]
@@ -107,7 +118,7 @@ def test_gh_adapter_detects_newer_version(tmp_path, monkeypatch):
 
 def test_gh_adapter_no_update_emits_nothing(tmp_path, monkeypatch):
     make_repo(tmp_path, {"blocky": GH_SPEC_CURRENT})
-    monkeypatch.setattr(requests, "get", lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.35.0"}))
+    stub_http(monkeypatch, lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.35.0"}))
 
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
@@ -119,7 +130,7 @@ def test_gh_adapter_strips_revision_suffix_before_compare(tmp_path, monkeypatch)
     # version difference — a GitHub release equal to the base version must not
     # emit an update.
     make_repo(tmp_path, {"blocky": GH_SPEC.replace("version: 0.34.0", "version: 0.34.0_1")})
-    monkeypatch.setattr(requests, "get", lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.34.0"}))
+    stub_http(monkeypatch, lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.34.0"}))
 
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
@@ -130,7 +141,7 @@ def test_gh_adapter_revision_suffix_still_emits_for_newer_remote(tmp_path, monke
     # Same revision-suffixed local version, but the remote genuinely moved:
     # the update must still be emitted.
     make_repo(tmp_path, {"blocky": GH_SPEC.replace("version: 0.34.0", "version: 0.34.0_1")})
-    monkeypatch.setattr(requests, "get", lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.36.0"}))
+    stub_http(monkeypatch, lambda url, **kwargs: FakeResponse(json_data={"tag_name": "v0.36.0"}))
 
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
@@ -146,7 +157,7 @@ def test_bsd_packagesite_adapter_detects_newer_version(tmp_path, monkeypatch):
             return FakeResponse(content=tzst_bytes([{"name": "btop", "version": "1.5.0"}]))
         raise AssertionError(f"unexpected url: {url}")
 
-    monkeypatch.setattr(requests, "get", fake_get)
+    stub_http(monkeypatch, fake_get)
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
     assert matrix["pkg"] == ["btop", "btop"]
@@ -161,7 +172,7 @@ def test_content_adapter_tracks_plugin_bundled_content(tmp_path, monkeypatch):
     # (e.g. the Homer dashboard) follows the upstream repo releases.
     make_repo(tmp_path, {"homer": CONTENT_SPEC})
 
-    monkeypatch.setattr(requests, "get", lambda url, **kw: FakeResponse(json_data={"tag_name": "v26.5.0"}))
+    stub_http(monkeypatch, lambda url, **kw: FakeResponse(json_data={"tag_name": "v26.5.0"}))
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
     assert matrix["include"] == [{"pkg": "homer", "abi_arch": "content", "version": "26.5.0"}]
@@ -169,7 +180,7 @@ def test_content_adapter_tracks_plugin_bundled_content(tmp_path, monkeypatch):
 
 def test_content_adapter_no_update_emits_nothing(tmp_path, monkeypatch):
     make_repo(tmp_path, {"homer": CONTENT_SPEC})
-    monkeypatch.setattr(requests, "get", lambda url, **kw: FakeResponse(json_data={"tag_name": "v26.4.2"}))
+    stub_http(monkeypatch, lambda url, **kw: FakeResponse(json_data={"tag_name": "v26.4.2"}))
 
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
@@ -218,3 +229,297 @@ pkg_manifest:
     matrix = check_updates(str(tmp_path / 'pkgs'))
 
     assert matrix == {"pkg": [], "include": []}
+
+
+def test_remote_lookups_run_concurrently_and_assemble_in_spec_order(tmp_path, monkeypatch):
+    other = GH_SPEC.replace("0xERR0R/blocky", "bastienwirtz/homer").replace("name: blocky", "name: zeta")
+    make_repo(tmp_path, {"blocky": GH_SPEC, "zeta": other})
+    both_in_flight = threading.Barrier(2, timeout=5)
+
+    def fake_get(url, **kwargs):
+        both_in_flight.wait()  # a sequential walk never gets the second lookup going
+        return FakeResponse(json_data={"tag_name": "v1.0.0" if "blocky" in url else "v2.0.0"})
+
+    stub_http(monkeypatch, fake_get)
+    matrix = check_updates(str(tmp_path / 'pkgs'), concurrency=2)
+
+    assert matrix["include"] == [
+        {"pkg": "blocky", "abi_arch": "ALL", "version": "1.0.0"},
+        {"pkg": "zeta", "abi_arch": "ALL", "version": "2.0.0"},
+    ]
+
+
+def test_http_cache_revalidates_packagesites_across_runs(tmp_path, monkeypatch):
+    make_repo(tmp_path, {"btop": REDISTRIBUTE_SPEC})
+    site = tzst_bytes([{"name": "btop", "version": "1.5.0"}])
+    requests_seen = []
+
+    def fake_get(url, headers=None, **kwargs):
+        requests_seen.append((url.rsplit("/", 1)[1], (headers or {}).get("If-None-Match")))
+        if headers and headers.get("If-None-Match") == f'"{url}"':
+            return FakeResponse(status_code=304)
+        body = {"text": "packing_format = tzst"} if url.endswith("meta.conf") else {"content": site}
+        return FakeResponse(headers={"ETag": f'"{url}"'}, **body)
+
+    stub_http(monkeypatch, fake_get)
+    cache = str(tmp_path / "http-cache")
+    runs = []
+    for _ in range(2):
+        monkeypatch.setattr(pkg_tool, "packagesite_cache", {})  # a fresh process
+        runs.append(check_updates(str(tmp_path / "pkgs"), http_cache=cache))
+
+    assert runs[0] == runs[1]
+    assert runs[1]["include"][0]["version"] == "1.5.0"
+    # the second run only revalidates: every fetch carries the stored ETag and gets a 304
+    first, second = requests_seen[:2], requests_seen[2:]
+    assert all(etag is None for _, etag in first)
+    assert [name for name, _ in second] == ["packagesite.pkg", "packagesite.pkg"]
+    assert all(etag for _, etag in second)
+
+
+def test_http_cache_max_age_and_eviction(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_get(url, headers=None, **kwargs):
+        calls.append(url)
+        return FakeResponse(content=b"x" * 100)
+
+    stub_http(monkeypatch, fake_get)
+    fresh = pkg_tool.HttpCache(str(tmp_path), max_age=3600, max_bytes=250)
+    for url in ("https://example.com/a", "https://example.com/b", "https://example.com/a"):
+        assert pkg_tool._cached_http_get(url, fresh).content == b"x" * 100
+    assert calls == ["https://example.com/a", "https://example.com/b"]
+
+    # a third body exceeds the bound: the least recently used entry (b) goes
+    pkg_tool._cached_http_get("https://example.com/c", fresh)
+    assert len(list(tmp_path.glob("*.body"))) == 2
+    pkg_tool._cached_http_get("https://example.com/a", fresh)
+    pkg_tool._cached_http_get("https://example.com/b", fresh)
+    assert calls[2:] == ["https://example.com/c", "https://example.com/b"]
+
+
+def test_http_cache_rejects_negative_max_age(tmp_path):
+    with pytest.raises(ValueError, match="http_cache_max_age"):
+        check_updates(str(tmp_path), http_cache=str(tmp_path / "c"), http_cache_max_age=-1)
+
+
+def test_packagesite_index_keeps_only_the_lookup_fields(monkeypatch):
+    lines = [
+        b'{"name":"btop","origin":"sysutils/btop","version":"1.4.7","comment":"top \\"version\\":\\"0\\"",'
+        b'"sum":"ab","path":"All/btop-1.4.7.pkg","licenses":["APACHE20"],'
+        b'"deps":{"libfoo":{"origin":"devel/libfoo","version":"2","path":"x"}}}\n',
+        b'\n',
+        b'{"origin":"x/late","deps":{"a":{"version":"0"}},"name":"late","version":"3","sum":"cd","path":"p"}\n',
+        b'{"name":"esc\\u0061ped","version":"4","sum":"ef","path":"All/escaped-4.pkg"}\n',
+        b'{"name":"btop","version":"9.9","sum":"00","path":"All/btop-9.9.pkg"}\n',
+    ]
+    parsed = []
+    real_loads = json.loads
+    monkeypatch.setattr(pkg_tool.json, "loads", lambda s, **kw: parsed.append(s) or real_loads(s, **kw))
+
+    index = pkg_tool.PackagesiteIndex(lines)
+
+    assert len(index) == 3 and "escaped" in index and "missing" not in index
+    assert index.get("btop") == {"name": "btop", "version": "1.4.7", "sum": "ab", "path": "All/btop-1.4.7.pkg"}
+    # a field behind a nested value is only trusted from a full parse
+    assert index.get("late") == {"name": "late", "version": "3", "sum": "cd", "path": "p"}
+    assert index.get("escaped")["version"] == "4"
+    assert index.get("missing") is None
+    assert parsed.count(lines[2]) == 1 and lines[0] not in parsed and lines[4] not in parsed
+
+
+@pytest.mark.parametrize("compression", ["zst", "xz", "gz", "bz2", ""])
+def test_packagesite_format_is_sniffed_without_meta_conf(tmp_path, monkeypatch, compression):
+    make_repo(tmp_path, {"btop": REDISTRIBUTE_SPEC})
+    site = tzst_bytes([{"name": "btop", "version": "1.5.0"}], compression)
+    urls = []
+
+    def fake_get(url, **kwargs):
+        urls.append(url)
+        return FakeResponse(content=site)
+
+    stub_http(monkeypatch, fake_get)
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    matrix = check_updates(str(tmp_path / "pkgs"))
+
+    assert [i["version"] for i in matrix["include"]] == ["1.5.0", "1.5.0"]
+    assert all(url.endswith("packagesite.pkg") for url in urls)
+
+
+def test_unrecognised_packagesite_falls_back_to_meta_conf(tmp_path, monkeypatch):
+    make_repo(tmp_path, {"btop": REDISTRIBUTE_SPEC})
+    urls = []
+
+    def fake_get(url, **kwargs):
+        urls.append(url.rsplit("/", 1)[1])
+        if url.endswith("meta.conf"):
+            return FakeResponse(text='packing_format = "tlz"')
+        return FakeResponse(content=b"not an archive")
+
+    stub_http(monkeypatch, fake_get)
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    with pytest.raises(ValueError, match="unsupported packagesite packing_format 'tlz'"):
+        check_updates(str(tmp_path / "pkgs"), concurrency=1)
+    assert urls[:2] == ["packagesite.pkg", "meta.conf"]
+
+
+def test_github_releases_resolve_in_one_graphql_query_with_a_token(tmp_path, monkeypatch):
+    make_repo(tmp_path, {
+        "blocky": GH_SPEC,
+        "homer": CONTENT_SPEC,
+        "gone": GH_SPEC.replace("0xERR0R/blocky", "someone/gone"),
+    })
+    stub_http(monkeypatch, lambda url, **kw: pytest.fail(f"unexpected REST call: {url}"))
+    monkeypatch.setenv("GITHUB_TOKEN", "secret")
+    posts = []
+
+    def fake_post(self, url, json=None, headers=None, **kwargs):
+        posts.append((url, json, headers))
+        tags = {"blocky": "v0.36.0", "homer": "v26.5.0"}
+        aliases = {f"r{k[len('name'):]}": v for k, v in json["variables"].items() if k.startswith("name")}
+        return FakeResponse(json_data={
+            "data": {alias: {"latestRelease": {"tagName": tags[name]}} if name in tags else None
+                     for alias, name in aliases.items()},
+            "errors": [{"path": [alias], "message": "Could not resolve to a Repository"}
+                       for alias, name in aliases.items() if name not in tags],
+        })
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    matrix = check_updates(str(tmp_path / "pkgs"))
+
+    assert matrix["include"] == [
+        {"pkg": "blocky", "abi_arch": "ALL", "version": "0.36.0"},
+        {"pkg": "homer", "abi_arch": "content", "version": "26.5.0"},
+    ]
+    assert matrix["errors"] == [{"pkg": "gone", "abi_arch": "ALL", "error":
+                                 "failed to get release info for https://github.com/someone/gone: "
+                                 "Could not resolve to a Repository"}]
+    url, body, headers = posts[0]
+    assert url == "https://api.github.com/graphql" and headers["Authorization"] == "bearer secret"
+    assert body["variables"] == {"owner0": "0xERR0R", "name0": "blocky", "owner1": "someone", "name1": "gone",
+                                 "owner2": "bastienwirtz", "name2": "homer"}
+    assert len(posts) == 1  # one query, whatever the number of repositories
+
+
+def test_github_rest_lookups_revalidate_with_stored_etags(tmp_path, monkeypatch):
+    make_repo(tmp_path, {"blocky": GH_SPEC})
+    seen = []
+
+    def fake_get(url, headers=None, **kwargs):
+        seen.append((headers or {}).get("If-None-Match"))
+        if seen[-1] == '"v36"':
+            return FakeResponse(status_code=304)
+        return FakeResponse(json_data={"tag_name": "v0.36.0"}, content=b'{"tag_name": "v0.36.0"}',
+                            headers={"ETag": '"v36"'})
+
+    stub_http(monkeypatch, fake_get)
+    runs = [check_updates(str(tmp_path / "pkgs"), http_cache=str(tmp_path / "cache")) for _ in range(2)]
+
+    assert runs[0] == runs[1]
+    assert runs[1]["include"][0]["version"] == "0.36.0"
+    assert seen == [None, '"v36"']
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pkg_tool.time, "sleep", delays.append)
+    monkeypatch.setattr(pkg_tool, "rate_limits", {})
+    return delays
+
+
+def test_transient_failures_are_retried_with_jittered_backoff(tmp_path, monkeypatch, no_sleep):
+    make_repo(tmp_path, {"blocky": GH_SPEC})
+    answers = [requests.ConnectionError("reset"), FakeResponse(status_code=502),
+               FakeResponse(status_code=429, headers={"Retry-After": "7"}),
+               FakeResponse(json_data={"tag_name": "v0.36.0"})]
+
+    def fake_get(url, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    stub_http(monkeypatch, fake_get)
+    matrix = check_updates(str(tmp_path / "pkgs"))
+
+    assert matrix == {"pkg": ["blocky"], "include": [{"pkg": "blocky", "abi_arch": "ALL", "version": "0.36.0"}]}
+    assert 0 <= no_sleep[0] <= pkg_tool.HTTP_BACKOFF and 0 <= no_sleep[1] <= 2 * pkg_tool.HTTP_BACKOFF
+    assert no_sleep[2] == 7
+
+
+def test_exhausted_rate_limit_holds_requests_until_its_reset(tmp_path, monkeypatch, no_sleep):
+    make_repo(tmp_path, {"blocky": GH_SPEC, "homer": CONTENT_SPEC})
+    reset = int(pkg_tool.time.time()) + 60
+
+    def fake_get(url, **kwargs):
+        tag = "v0.36.0" if "blocky" in url else "v26.5.0"
+        return FakeResponse(json_data={"tag_name": tag},
+                            headers={"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(reset)})
+
+    stub_http(monkeypatch, fake_get)
+    matrix = check_updates(str(tmp_path / "pkgs"), concurrency=1)
+
+    assert len(matrix["include"]) == 2
+    assert len(no_sleep) == 1 and 0 < no_sleep[0] <= 60  # the second request waited for the reset
+
+
+def test_failed_source_only_drops_its_own_rows(tmp_path, monkeypatch, no_sleep):
+    make_repo(tmp_path, {"blocky": GH_SPEC, "btop": REDISTRIBUTE_SPEC})
+
+    def fake_get(url, **kwargs):
+        if "api.github.com" in url:
+            return FakeResponse(json_data={"tag_name": "v0.36.0"})
+        return FakeResponse(status_code=503)
+
+    stub_http(monkeypatch, fake_get)
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    matrix = check_updates(str(tmp_path / "pkgs"))
+
+    assert matrix["include"] == [{"pkg": "blocky", "abi_arch": "ALL", "version": "0.36.0"}]
+    assert [(e["pkg"], e["abi_arch"]) for e in matrix["errors"]] == [
+        ("btop", "FreeBSD-14-amd64"), ("btop", "FreeBSD-15-amd64")]
+    assert "HTTP 503" in matrix["errors"][0]["error"]
+    assert len(no_sleep) == 2 * pkg_tool.HTTP_RETRIES  # each packagesite retried before giving up
+
+
+def test_malformed_graphql_answer_fails_only_the_github_rows(tmp_path, monkeypatch):
+    make_repo(tmp_path, {"blocky": GH_SPEC, "btop": REDISTRIBUTE_SPEC})
+    site = tzst_bytes([{"name": "btop", "version": "1.5.0"}])
+    stub_http(monkeypatch, lambda url, **kw: FakeResponse(content=site))
+    monkeypatch.setenv("GITHUB_TOKEN", "secret")
+
+    class NotJson(FakeResponse):
+        def json(self):
+            return json.loads(self.text)
+
+    monkeypatch.setattr(requests.Session, "post", lambda self, url, **kw: NotJson(text="<html>maintenance</html>"))
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    matrix = check_updates(str(tmp_path / "pkgs"))
+
+    assert [i["pkg"] for i in matrix["include"]] == ["btop", "btop"]
+    assert [(e["pkg"], e["abi_arch"]) for e in matrix["errors"]] == [("blocky", "ALL")]
+    assert "malformed answer from GitHub GraphQL API" in matrix["errors"][0]["error"]
+
+
+def test_programming_errors_are_not_reported_as_source_errors(tmp_path, monkeypatch):
+    make_repo(tmp_path, {"blocky": GH_SPEC, "btop": REDISTRIBUTE_SPEC})
+    stub_http(monkeypatch, lambda url, **kw: FakeResponse(json_data={"tag_name": "v0.36.0"}))
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    monkeypatch.setattr(pkg_tool, "_load_packagesite", lambda *a, **kw: None)  # has no .get
+
+    with pytest.raises(AttributeError):
+        check_updates(str(tmp_path / "pkgs"))
+
+
+def test_cli_keeps_errors_out_of_the_matrix_and_writes_them_to_the_errors_file(tmp_path, monkeypatch, capsys):
+    partial = {"pkg": ["blocky"], "include": [{"pkg": "blocky", "abi_arch": "ALL", "version": "0.36.0"}],
+               "errors": [{"pkg": "btop", "abi_arch": "FreeBSD-15-amd64", "error": "HTTP 503"}]}
+    monkeypatch.setattr(pkg_tool, "check_updates", lambda *a: json.loads(json.dumps(partial)))
+    errors_file = tmp_path / "errors.json"
+    monkeypatch.setattr("sys.argv", ["pkg-tool", "check-updates", "--errors-file", str(errors_file)])
+
+    pkg_tool.main()
+
+    assert json.loads(capsys.readouterr().out) == {"pkg": partial["pkg"], "include": partial["include"]}
+    assert json.loads(errors_file.read_text()) == partial["errors"]
@@ -20,7 +20,8 @@ import pytest
 import yaml
 import zstandard as zstd
 
-from pkg_tool import pack
+import pkg_tool
+from pkg_tool import pack, pack_batch
 
 FIXTURE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -273,3 +274,294 @@ def test_pack_fails_loudly_when_payload_missing(tmp_path):
 
     with pytest.raises(FileNotFoundError):
         pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+
+
+def test_pack_single_scan_orders_members_and_skips_links_in_flatsize(tmp_path):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    os.symlink("blocky", os.path.join(payload, "usr/local/bin/blocky-link"))
+
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+
+    members, manifests = unpack(os.path.join(dist, "blocky-0.34.0.pkg"))
+    # files first, symlinks last — all from the one payload scan
+    assert list(members)[-1] == "/usr/local/bin/blocky-link"
+    assert members["/usr/local/bin/blocky-link"].issym()
+    assert members["/usr/local/bin/blocky-link"].linkname == "blocky"
+    assert members["/usr/local/bin/blocky"].mode == 0o755
+    manifest = manifests["+MANIFEST"]
+    assert list(manifest["files"]) == sorted(manifest["files"])
+    assert manifest["flatsize"] == GOLDEN_MANIFEST["flatsize"]
+
+
+def test_pack_is_byte_identical_for_any_hashing_job_count(tmp_path):
+    outputs = []
+    for jobs in (1, 4):
+        config, payload, dist = make_fixture(tmp_path / str(jobs), SPEC)
+        pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, jobs=jobs)
+        with open(os.path.join(dist, "blocky-0.34.0.pkg"), "rb") as f:
+            outputs.append(f.read())
+    assert outputs[0] == outputs[1]
+
+
+def test_pack_rejects_zero_jobs(tmp_path):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+
+    with pytest.raises(ValueError, match="jobs"):
+        pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, jobs=0)
+
+
+def test_pack_honours_spec_compression_and_cli_override(tmp_path):
+    spec = SPEC.replace("build_config:\n", "build_config:\n  compression:\n    level: 19\n    threads: 2\n    long: true\n")
+    sizes = {}
+    for label, override in (("spec", None), ("cli", {"level": 1, "threads": None, "long": False})):
+        config, payload, dist = make_fixture(tmp_path / label, spec)
+        pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, compression=override)
+        pkg_path = os.path.join(dist, "blocky-0.34.0.pkg")
+        # stock decoders (default window limit) must still read it
+        members, manifests = unpack(pkg_path)
+        assert list(members) == EXPECTED_MEMBERS
+        assert manifests["+MANIFEST"]["files"] == GOLDEN_MANIFEST["files"]
+        sizes[label] = os.path.getsize(pkg_path)
+    assert sizes["spec"] != sizes["cli"]
+
+
+def test_pack_digests_package_while_writing_without_rereading(tmp_path, monkeypatch):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    hashed = []
+    real_hash_member = pkg_tool._hash_member
+    monkeypatch.setattr(pkg_tool, "_hash_member", lambda path, keep: hashed.append(path) or real_hash_member(path, keep))
+
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+
+    pkg_path = os.path.join(dist, "blocky-0.34.0.pkg")
+    assert pkg_path not in hashed
+    with open(os.path.join(dist, "packagesite_info.json")) as f:
+        info = json.load(f)
+    with open(pkg_path, "rb") as f:
+        assert info["sum"] == hashlib.sha256(f.read()).hexdigest()
+    assert info["pkgsize"] == os.path.getsize(pkg_path)
+
+
+def test_digest_cache_skips_unchanged_files_and_rehashes_changed_ones(tmp_path, monkeypatch):
+    _, payload, _ = make_fixture(tmp_path, SPEC)
+    cache_path = str(tmp_path / "cache" / "digests.json")
+    first = pkg_tool._load_digest_cache(cache_path)
+    index = pkg_tool._scan_payload(payload, jobs=1, digest_cache=first)
+    pkg_tool._save_digest_cache(cache_path, first)
+
+    changed = os.path.join(payload, "usr/local/etc/blocky/config.yml")
+    with open(changed, "w") as f:
+        f.write("config: {changed: true}\n")
+    hashed = []
+    real_hash_member = pkg_tool._hash_member
+    monkeypatch.setattr(pkg_tool, "_hash_member", lambda path, keep: hashed.append(path) or real_hash_member(path, keep))
+
+    rescanned = pkg_tool._scan_payload(payload, jobs=1, digest_cache=pkg_tool._load_digest_cache(cache_path))
+
+    assert hashed == [changed]
+    assert [e.digest for e in rescanned if e.path != changed] == [e.digest for e in index if e.path != changed]
+
+
+def test_pack_reads_small_payload_files_once(tmp_path, monkeypatch):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    big = os.path.join(payload, "usr/local/share/big.bin")
+    os.makedirs(os.path.dirname(big), exist_ok=True)
+    with open(big, "wb") as f:
+        f.write(os.urandom(pkg_tool.PAYLOAD_INLINE_MAX + 1))
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda file, *a, **kw: opened.append(str(file)) or real_open(file, *a, **kw))
+
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, jobs=1)
+
+    reads = {path: opened.count(path) for path in opened if path.startswith(payload)}
+    assert reads.pop(big) == 2  # hashed, then streamed into the tarball
+    assert reads and set(reads.values()) == {1}
+
+def test_digest_cache_is_lru_bounded(tmp_path):
+    cache_path = str(tmp_path / "digests.json")
+    pkg_tool._save_digest_cache(cache_path, {"a": "1", "b": "2", "c": "3"}, max_entries=2)
+
+    assert pkg_tool._load_digest_cache(cache_path) == {"b": "2", "c": "3"}
+
+
+def test_pack_reuses_output_cache_when_inputs_are_unchanged(tmp_path, monkeypatch):
+    cache = str(tmp_path / "pack-cache")
+    config, payload, dist = make_fixture(tmp_path / "first", SPEC)
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, output_cache=cache)
+    with open(os.path.join(dist, "blocky-0.34.0.pkg"), "rb") as f:
+        first = f.read()
+
+    def no_repack(*args, **kwargs):
+        raise AssertionError("unchanged inputs must not be repacked")
+
+    monkeypatch.setattr(pkg_tool, "_create_pkg", no_repack)
+    config, payload, dist = make_fixture(tmp_path / "second", SPEC)
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist, output_cache=cache)
+
+    with open(os.path.join(dist, "blocky-0.34.0.pkg"), "rb") as f:
+        assert f.read() == first
+    assert sorted(os.listdir(dist)) == ["blocky-0.34.0.pkg", "packagesite_info.json"]
+
+    # any input change (here: the ABI) misses the cache
+    config, payload, dist = make_fixture(tmp_path / "third", SPEC)
+    with pytest.raises(AssertionError, match="repacked"):
+        pack(config, abi="14", arch="amd64", payload_dir=payload, output_dir=dist, output_cache=cache)
+
+
+def test_output_cache_evicts_least_recently_used_entries_beyond_max_bytes(tmp_path):
+    cache = tmp_path / "pack-cache"
+    for age, name in enumerate(["newest", "used", "oldest"]):
+        (cache / name).mkdir(parents=True)
+        (cache / name / "blocky-0.34.0.pkg").write_bytes(b"x" * 100)
+        (cache / name / "packagesite_info.json").write_bytes(b"{}")
+        os.utime(cache / name, (1000 - age, 1000 - age))
+    (cache / "staging.tmp").mkdir()  # another pack still storing its entry
+    (tmp_path / "dist").mkdir()
+
+    assert pkg_tool._restore_cached_pack(str(cache / "used"), str(tmp_path / "dist" / "blocky-0.34.0.pkg"),
+                                         str(tmp_path / "dist"))
+    pkg_tool._evict_output_cache(str(cache), max_bytes=150)
+
+    assert sorted(os.listdir(cache)) == ["staging.tmp", "used"]
+
+
+def test_pack_batch_packs_jobs_concurrently_and_reports_failures(tmp_path):
+    blocky_config, blocky_payload, blocky_dist = make_fixture(tmp_path / "blocky", SPEC)
+    plugin_config, plugin_payload, plugin_dist = make_plugin_fixture(tmp_path / "plugin")
+    jobs = [
+        {"config": blocky_config, "payload_dir": blocky_payload, "abi": 15, "arch": "amd64", "output_dir": blocky_dist},
+        {"config": blocky_config, "payload_dir": str(tmp_path / "missing"), "abi": 15, "arch": "amd64",
+         "output_dir": str(tmp_path)},
+        {"config": plugin_config, "payload_dir": plugin_payload, "abi": 15, "arch": "amd64", "output_dir": plugin_dist},
+    ]
+
+    results = pack_batch(jobs, workers=2, digest_cache=str(tmp_path / "digests.json"))
+
+    assert [r["status"] for r in results] == ["ok", "error", "ok"]
+    assert "Payload directory not found" in results[1]["error"]
+    assert sorted(os.listdir(blocky_dist)) == ["blocky-0.34.0.pkg", "packagesite_info.json"]
+    assert sorted(os.listdir(plugin_dist)) == ["os-caddy-2.2.0.pkg", "packagesite_info.json"]
+    # both workers' digests were merged into the shared cache (the plugin's
+    # generated version annotation and license aliases are never on disk)
+    assert len(pkg_tool._load_digest_cache(str(tmp_path / "digests.json"))) == 5 + 3
+
+
+def test_pack_batch_removes_a_shared_payload_after_its_last_job(tmp_path):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    jobs = [{"config": config, "payload_dir": payload, "abi": 15, "arch": arch,
+             "output_dir": os.path.join(dist, arch)} for arch in ("amd64", "aarch64")]
+    for job in jobs:
+        os.makedirs(job["output_dir"])
+
+    results = pack_batch(jobs, workers=2)
+
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    for arch in ("amd64", "aarch64"):
+        assert sorted(os.listdir(os.path.join(dist, arch))) == ["blocky-0.34.0.pkg", "packagesite_info.json"]
+    assert not os.path.exists(payload)
+
+def test_pack_batch_jobs_must_not_share_an_output_dir(tmp_path, monkeypatch):
+    # pack stages +MANIFEST/+COMPACT_MANIFEST and packagesite_info.json under
+    # fixed names in its output dir; two concurrent jobs there would clobber them
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="job 1: output_dir .* is already used by job 0"):
+        pack_batch([
+            {"config": "a/config.yml", "abi": 15, "arch": "amd64", "output_dir": "dist"},
+            {"config": "b/config.yml", "abi": 15, "arch": "amd64", "output_dir": str(tmp_path / "dist") + "/"},
+        ])
+    with pytest.raises(ValueError, match="job 1: output_dir '.' is already used by job 0"):
+        pack_batch([
+            {"config": "a/config.yml", "abi": 15, "arch": "amd64"},
+            {"config": "b/config.yml", "abi": 15, "arch": "aarch64"},
+        ])
+    with pytest.raises(TypeError, match="pack-batch jobs must be a non-empty list"):
+        pack_batch([])
+
+
+def test_streamed_manifest_matches_json_dump_bytes(tmp_path):
+    _, payload, _ = make_fixture(tmp_path, SPEC)
+    odd = os.path.join(payload, 'usr/local/share/doc/blocky/Ünïcode "quoted".txt')
+    with open(odd, "w") as f:
+        f.write("x\n")
+    index = pkg_tool._scan_payload(payload, jobs=1)
+    manifest = {"name": "blocky", "version": "0.34.0", "desc": "multi\nline ✓"}
+
+    pkg_tool._write_manifest(str(tmp_path / "+MANIFEST"), manifest, index)
+
+    expected = json.dumps({**manifest, "files": {e.arcname: e.digest for e in index}}, separators=(",", ":"))
+    assert (tmp_path / "+MANIFEST").read_text() == expected
+    pkg_tool._write_manifest(str(tmp_path / "empty"), {}, ())
+    assert (tmp_path / "empty").read_text() == json.dumps({"files": {}}, separators=(",", ":"))
+
+
+def test_pack_overlay_mapping_packs_sources_in_place(tmp_path):
+    spec = PLUGIN_SPEC + """\
+payload:
+  - src: src/opnsense
+    dest: usr/local/opnsense
+  - src: src/etc
+    dest: usr/local/etc
+  - src: src/etc/rc.d/caddy
+    dest: usr/local/etc/rc.d/caddy
+    mode: 0755
+  - src: ../../LICENSE
+    dest: usr/local/share/doc/os-caddy/LICENSE
+"""
+    cfg_dir = tmp_path / "pkgs" / "caddy"
+    model = cfg_dir / "src/opnsense/mvc/app/models/OPNsense/Caddy"
+    model.mkdir(parents=True)
+    (model / "Caddy.xml").write_text("<model/>")
+    (cfg_dir / "src/etc/rc.d").mkdir(parents=True)
+    (cfg_dir / "src/etc/rc.d/caddy").write_text("#!/bin/sh\n")
+    (tmp_path / "LICENSE").write_text("BSD 2-clause fixture text\n")
+    (cfg_dir / "config.yml").write_text(spec)
+    dist = tmp_path / "dist"
+    dist.mkdir()
+
+    pack(str(cfg_dir / "config.yml"), abi="15", arch="amd64",
+         payload_dir=str(dist / "pkg"), output_dir=str(dist))
+
+    pkg_path = str(dist / "os-caddy-2.2.0.pkg")
+    members, manifests = unpack(pkg_path)
+    assert members["/usr/local/etc/rc.d/caddy"].mode == 0o755
+    assert members["/usr/local/opnsense/mvc/app/models/OPNsense/Caddy/Caddy.xml"].mode == 0o644
+    assert members["/usr/local/share/licenses/os-caddy-2.2.0/BSD2CLAUSE"].size == 26
+    # the version annotation is generated in memory, never written into the source tree
+    with open(pkg_path, "rb") as f, zstd.ZstdDecompressor().stream_reader(f) as s:
+        with tarfile.open(fileobj=io.BytesIO(s.read()), mode="r:") as tar:
+            version = json.loads(tar.extractfile("/usr/local/opnsense/version/caddy").read())
+    assert version["product_id"] == "os-caddy"
+    assert not (cfg_dir / "src/opnsense/version").exists()
+    assert "run_migrations.php OPNsense/Caddy" in manifests["+MANIFEST"]["scripts"]["post-install"]
+    assert (cfg_dir / "src/etc/rc.d/caddy").exists()
+
+
+def test_pack_overlay_must_not_shadow_staged_files(tmp_path):
+    spec = PLUGIN_SPEC + "payload:\n  - src: inc\n    dest: usr/local/etc/inc/plugins.inc.d\n"
+    config, payload, dist = make_plugin_fixture(tmp_path, spec)
+    inc = tmp_path / "pkgs" / "caddy" / "inc"
+    inc.mkdir()
+    (inc / "caddy.inc").write_text("<?php // overlay\n")
+
+    with pytest.raises(ValueError, match="shadows staged file /usr/local/etc/inc/plugins.inc.d/caddy.inc"):
+        pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+
+
+def test_pack_profile_records_each_phase(tmp_path, monkeypatch):
+    config, payload, dist = make_fixture(tmp_path, SPEC)
+    monkeypatch.setattr(pkg_tool, "profile_phases", [])
+
+    pack(config, abi="15", arch="amd64", payload_dir=payload, output_dir=dist)
+
+    phases = {record["phase"]: record for record in pkg_tool.profile_phases}
+    assert list(phases) == ["scan", "hash", "manifest", "compress", "packagesite info"]
+    assert phases["hash"]["files"] == 4  # the license alias is added after hashing
+    assert phases["compress"]["bytes_out"] == os.path.getsize(os.path.join(dist, "blocky-0.34.0.pkg"))
+    assert all(record["wall_s"] >= 0 and record["cpu_s"] >= 0 for record in phases.values())
+
+    report = tmp_path / "profile.json"
+    pkg_tool._write_profile(str(report), "pack", pkg_tool.profile_phases, 1.5, 0.5)
+    written = json.loads(report.read_text())
+    assert written["phases"][0]["phase"] == "scan"
+    assert "not additive" in written["phase_cpu_s"]
@@ -0,0 +1,327 @@
+"""Tests for redistribution downloads: packages stream to disk in chunks,
+resume with HTTP Range after a dropped connection and land atomically.
+Network is stubbed via monkeypatched requests."""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+import pytest
+import requests
+import zstandard as zstd
+
+import pkg_tool
+from test_check_updates import REDISTRIBUTE_SPEC, FakeResponse, stub_http, tzst_bytes
+
+PAYLOAD = bytes(range(256)) * 64  # 16 KiB
+
+
+def pkg_bytes(manifest):
+    """A minimal .pkg: a zstd tar holding just +COMPACT_MANIFEST."""
+    raw = json.dumps(manifest).encode()
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        info = tarfile.TarInfo("+COMPACT_MANIFEST")
+        info.size = len(raw)
+        tar.addfile(info, io.BytesIO(raw))
+    return zstd.ZstdCompressor().compress(data.getvalue())
+
+
+BTOP_PKG = pkg_bytes({"name": "btop", "version": "1.4.7", "abi": "FreeBSD:15:amd64"})
+
+
+class FakeStream:
+    """A streamed response that can drop the connection after `cut` bytes."""
+
+    def __init__(self, status_code=200, body=b"", cut=None, headers=None):
+        self.status_code = status_code
+        self.headers = {"Content-Length": str(len(body))} if headers is None else headers
+        self._body = body
+        self._cut = cut
+
+    def iter_content(self, chunk_size):
+        end = len(self._body) if self._cut is None else self._cut
+        for i in range(0, end, 1000):
+            yield self._body[i:min(i + 1000, end)]
+        if self._cut is not None:
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pkg_tool.time, "sleep", delays.append)
+    return delays
+
+
+def test_download_resumes_with_range_after_a_dropped_connection(tmp_path, monkeypatch, no_sleep):
+    requests_seen = []
+
+    def fake_get(url, headers=None, **kwargs):
+        assert kwargs["stream"] is True
+        assert headers["Accept-Encoding"] == "identity"
+        requests_seen.append((headers.get("Range"), headers.get("If-Range")))
+        if len(requests_seen) == 1:
+            return FakeStream(body=PAYLOAD, cut=5000, headers={"Content-Length": str(len(PAYLOAD)), "ETag": '"v1"'})
+        start = int(headers["Range"][len("bytes="):-1])
+        return FakeStream(206, PAYLOAD[start:], headers={
+            "Content-Length": str(len(PAYLOAD) - start),
+            "Content-Range": f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}"})
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    target = tmp_path / "btop-1.4.7.pkg"
+
+    digest = pkg_tool._download_pkg("https://mirror/btop-1.4.7.pkg", str(target))
+
+    assert requests_seen == [(None, None), ("bytes=5000-", '"v1"')]
+    assert no_sleep == [pkg_tool.DOWNLOAD_BACKOFF]
+    assert target.read_bytes() == PAYLOAD
+    assert digest == (hashlib.sha256(PAYLOAD).hexdigest(), len(PAYLOAD))
+    assert not (tmp_path / "btop-1.4.7.pkg.part").exists()
+
+
+def test_download_starts_over_when_the_package_changed_between_attempts(tmp_path, monkeypatch, no_sleep):
+    changed = PAYLOAD[::-1]
+    requests_seen = []
+
+    def fake_get(url, headers=None, **kwargs):
+        requests_seen.append((headers.get("Range"), headers.get("If-Range")))
+        if len(requests_seen) == 1:
+            return FakeStream(body=PAYLOAD, cut=5000, headers={"Content-Length": str(len(PAYLOAD)),
+                                                               "ETag": 'W/"weak"', "Last-Modified": "Mon, 1 Jun 2026"})
+        # If-Range no longer matches: the whole new package
+        return FakeStream(200, changed)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    digest = pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+
+    assert requests_seen == [(None, None), ("bytes=5000-", "Mon, 1 Jun 2026")]
+    assert (tmp_path / "btop.pkg").read_bytes() == changed
+    assert digest == (hashlib.sha256(changed).hexdigest(), len(changed))
+
+
+def test_download_discards_a_partial_file_left_by_an_earlier_run(tmp_path, monkeypatch, no_sleep):
+    (tmp_path / "btop.pkg.part").write_bytes(b"stale partial bytes")
+    ranges = []
+
+    def fake_get(url, headers=None, **kwargs):
+        ranges.append(headers.get("Range"))
+        return FakeStream(200, PAYLOAD)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    digest = pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+
+    assert ranges == [None]
+    assert (tmp_path / "btop.pkg").read_bytes() == PAYLOAD
+    assert digest == (hashlib.sha256(PAYLOAD).hexdigest(), len(PAYLOAD))
+
+
+def test_download_restarts_when_server_ignores_range(tmp_path, monkeypatch, no_sleep):
+    calls = []
+
+    def fake_get(url, headers=None, **kwargs):
+        calls.append(headers.get("Range"))
+        return FakeStream(200, PAYLOAD, cut=5000 if len(calls) == 1 else None)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    digest = pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+
+    assert calls == [None, "bytes=5000-"]
+    assert (tmp_path / "btop.pkg").read_bytes() == PAYLOAD
+    assert digest == (hashlib.sha256(PAYLOAD).hexdigest(), len(PAYLOAD))
+
+
+def test_download_restarts_when_partial_content_is_not_the_continuation(tmp_path, monkeypatch, no_sleep):
+    ranges = []
+
+    def fake_get(url, headers=None, **kwargs):
+        ranges.append(headers.get("Range"))
+        if len(ranges) == 1:
+            return FakeStream(body=PAYLOAD, cut=5000)
+        if headers.get("Range"):  # a broken cache answering from the wrong offset
+            return FakeStream(206, PAYLOAD, headers={"Content-Range": f"bytes 0-{len(PAYLOAD) - 1}/{len(PAYLOAD)}"})
+        return FakeStream(200, PAYLOAD)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    digest = pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+
+    assert ranges == [None, "bytes=5000-", None]
+    assert (tmp_path / "btop.pkg").read_bytes() == PAYLOAD
+    assert digest == (hashlib.sha256(PAYLOAD).hexdigest(), len(PAYLOAD))
+
+
+def test_download_does_not_compare_decoded_bytes_with_an_encoded_length(tmp_path, monkeypatch, no_sleep):
+    # a server ignoring Accept-Encoding: identity; requests hands over the decoded body
+    monkeypatch.setattr(requests, "get", lambda url, headers=None, **kwargs: FakeStream(
+        200, PAYLOAD, headers={"Content-Length": "1234", "Content-Encoding": "gzip"}))
+
+    digest = pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+
+    assert digest == (hashlib.sha256(PAYLOAD).hexdigest(), len(PAYLOAD))
+    assert no_sleep == []
+
+
+def test_download_backs_off_then_gives_up_without_a_partial_package(tmp_path, monkeypatch, no_sleep):
+    monkeypatch.setattr(requests, "get", lambda url, headers=None, **kwargs: FakeStream(503))
+
+    with pytest.raises(ValueError, match="after 4 attempts: HTTP 503"):
+        pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"), retries=3)
+    assert no_sleep == [1.0, 2.0, 4.0]
+    assert not (tmp_path / "btop.pkg").exists()
+
+
+def test_download_removes_the_partial_file_when_giving_up(tmp_path, monkeypatch, no_sleep):
+    monkeypatch.setattr(requests, "get", lambda url, headers=None, **kwargs: FakeStream(body=PAYLOAD, cut=5000))
+
+    with pytest.raises(ValueError, match="after 2 attempts"):
+        pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"), retries=1)
+    assert not (tmp_path / "btop.pkg.part").exists()
+
+
+def test_download_does_not_retry_client_errors(tmp_path, monkeypatch, no_sleep):
+    monkeypatch.setattr(requests, "get", lambda url, headers=None, **kwargs: FakeStream(404))
+
+    with pytest.raises(ValueError, match="HTTP 404"):
+        pkg_tool._download_pkg("https://mirror/btop.pkg", str(tmp_path / "btop.pkg"))
+    assert no_sleep == []
+
+
+def upstream(monkeypatch, body=BTOP_PKG, listed_sum=None, listed_version="1.4.7"):
+    """Stub the mirror: packagesite listing btop listed_version with listed_sum, and the btop 1.4.7 package."""
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    downloads = []
+    entry = {"name": "btop", "version": listed_version, "sum": listed_sum or hashlib.sha256(BTOP_PKG).hexdigest()}
+
+    def fake_get(url, headers=None, **kwargs):
+        if url.endswith("meta.conf"):
+            return FakeResponse(text="packing_format = tzst")
+        if url.endswith("packagesite.pkg"):
+            return FakeResponse(content=tzst_bytes([entry]))
+        assert url == "http://pkg.freebsd.org/FreeBSD:15:amd64/quarterly/All/btop-1.4.7.pkg"
+        downloads.append(url)
+        return FakeStream(200, body)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    stub_http(monkeypatch, fake_get)
+    return downloads
+
+
+def test_redistribute_reuses_verified_cached_package(tmp_path, monkeypatch):
+    config = tmp_path / "config.yml"
+    config.write_text(REDISTRIBUTE_SPEC)
+    cache = tmp_path / "cache"
+    downloads = upstream(monkeypatch)
+
+    for run in ("first", "second"):
+        out = tmp_path / run
+        out.mkdir()
+        pkg_tool.redistribute_pkg(str(config), "15", "amd64", str(out), cache_dir=str(cache))
+        assert (out / "btop-1.4.7.pkg").read_bytes() == BTOP_PKG
+
+    assert len(downloads) == 1
+    assert os.listdir(cache) == [hashlib.sha256(BTOP_PKG).hexdigest() + ".pkg"]
+    with open(tmp_path / "second" / "packagesite_info.json") as f:
+        assert json.load(f)["sum"] == hashlib.sha256(BTOP_PKG).hexdigest()
+
+    # a corrupted cache entry is dropped and downloaded again
+    (cache / os.listdir(cache)[0]).write_bytes(b"bit rot")
+    out = tmp_path / "third"
+    out.mkdir()
+    pkg_tool.redistribute_pkg(str(config), "15", "amd64", str(out), cache_dir=str(cache))
+    assert len(downloads) == 2
+    assert (out / "btop-1.4.7.pkg").read_bytes() == BTOP_PKG
+
+
+def test_redistribute_rejects_download_not_matching_upstream_sum(tmp_path, monkeypatch):
+    config = tmp_path / "config.yml"
+    config.write_text(REDISTRIBUTE_SPEC)
+    upstream(monkeypatch, body=b"tampered")
+
+    with pytest.raises(ValueError, match="does not match the upstream packagesite sum"):
+        pkg_tool.redistribute_pkg(str(config), "15", "amd64", str(tmp_path), cache_dir=str(tmp_path / "cache"))
+    assert not (tmp_path / "btop-1.4.7.pkg").exists()
+    assert not (tmp_path / "cache").exists()
+
+
+def test_redistribute_falls_back_to_unverified_download_for_unlisted_version(tmp_path, monkeypatch, caplog):
+    # the quarterly packagesite moved past the pin, but the package is still on the mirror
+    config = tmp_path / "config.yml"
+    config.write_text(REDISTRIBUTE_SPEC)
+    downloads = upstream(monkeypatch, listed_version="1.4.8")
+
+    pkg_tool.redistribute_pkg(str(config), "15", "amd64", str(tmp_path), cache_dir=str(tmp_path / "cache"))
+
+    assert (tmp_path / "btop-1.4.7.pkg").read_bytes() == BTOP_PKG
+    assert len(downloads) == 1
+    assert not (tmp_path / "cache").exists()
+    assert "downloading it unverified and uncached" in caplog.text
+
+def test_redistribute_all_downloads_every_abi_arch_over_one_session(tmp_path, monkeypatch):
+    pkgs = tmp_path / "pkgs"
+    for name, spec in (("btop", REDISTRIBUTE_SPEC),
+                       ("htop", REDISTRIBUTE_SPEC.replace("btop", "htop").replace('"1.4.7"', '"3.4.1"')),
+                       ("plain", "build_config:\n  include: {}\npkg_manifest:\n  name: plain\n"
+                                 "  origin: opnware/plain\n  version: 1.0\n")):
+        (pkgs / name).mkdir(parents=True)
+        (pkgs / name / "config.yml").write_text(spec)
+    sessions = set()
+
+    def fake_get(self, url, headers=None, **kwargs):
+        sessions.add(id(self))
+        name = url.rsplit("/", 1)[1]
+        if name == "htop-3.4.1.pkg" and "FreeBSD:14" in url:
+            return FakeStream(404)
+        return FakeStream(200, pkg_bytes({"name": name.split("-")[0], "abi": url.split("/")[3]}))
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    out = tmp_path / "dist"
+
+    results = pkg_tool.redistribute_all(str(pkgs), str(out), concurrency=3)
+
+    assert [(r["pkg"], r["abi_arch"], r["status"]) for r in results] == [
+        ("btop", "FreeBSD-14-amd64", "ok"), ("btop", "FreeBSD-15-amd64", "ok"),
+        ("htop", "FreeBSD-14-amd64", "error"), ("htop", "FreeBSD-15-amd64", "ok"),
+    ]
+    assert "HTTP 404" in results[2]["error"]
+    assert len(sessions) == 1
+    assert sorted(os.listdir(out / "btop" / "FreeBSD-15-amd64")) == ["btop-1.4.7.pkg", "packagesite_info.json"]
+    with open(out / "htop" / "FreeBSD-15-amd64" / "packagesite_info.json") as f:
+        assert json.load(f)["path"] == "All/htop-3.4.1.pkg"
+
+
+def test_concurrent_loads_of_one_packagesite_share_a_single_fetch(monkeypatch):
+    monkeypatch.setattr(pkg_tool, "packagesite_cache", {})
+    fetches = []
+    site = tzst_bytes([{"name": "btop", "version": "1.4.7", "sum": "ab"}])
+
+    def fake_get(url, **kwargs):
+        fetches.append(url)
+        time.sleep(0.05)  # keep the fetch in flight while the other threads arrive
+        if len(fetches) == 1:
+            return FakeResponse(status_code=503, headers={"Retry-After": "100000"})  # not retried
+        return FakeResponse(content=site)
+
+    stub_http(monkeypatch, fake_get)
+    load = lambda: pkg_tool._load_packagesite("http://pkg.freebsd.org", "FreeBSD-15-amd64", "quarterly")
+
+    with pytest.raises(ValueError, match="HTTP 503"):
+        load()  # a failed fetch is not cached
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load().get("btop"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 2
+    assert [r["sum"] for r in results] == ["ab"] * 8
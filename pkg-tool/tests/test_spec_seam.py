@@ -155,6 +155,29 @@ class TestValidation:
         with pytest.raises(ValueError, match="pkg_service"):
             _load_spec(str(tmp_path / "pkgs" / "pkg" / "config.yml"))
 
+    def test_bad_compression_level_names_the_key(self, tmp_path):
+        broken = BUILD_SPEC.replace("build_config:\n", "build_config:\n  compression:\n    level: 40\n")
+        write(tmp_path, "pkg", broken)
+        with pytest.raises(ValueError, match=r"build_config\.compression\.level"):
+            _load_spec(str(tmp_path / "pkgs" / "pkg" / "config.yml"))
+
+    def test_unknown_compression_setting_rejected(self, tmp_path):
+        broken = BUILD_SPEC.replace("build_config:\n", "build_config:\n  compression:\n    window: 31\n")
+        write(tmp_path, "pkg", broken)
+        with pytest.raises(ValueError, match=r"build_config\.compression\.window"):
+            _load_spec(str(tmp_path / "pkgs" / "pkg" / "config.yml"))
+
+    def test_payload_mapping_validated(self, tmp_path):
+        mapped = BUILD_SPEC + "payload:\n  - src: src/etc\n    dest: usr/local/etc\n    mode: 0755\n"
+        write(tmp_path, "pkg", mapped)
+        assert _load_spec(str(tmp_path / "pkgs" / "pkg" / "config.yml"))["payload"][0]["mode"] == 0o755
+        write(tmp_path, "bad", mapped.replace("usr/local/etc", "../etc"))
+        with pytest.raises(ValueError, match=r"payload\[0\]\.dest"):
+            _load_spec(str(tmp_path / "pkgs" / "bad" / "config.yml"))
+        write(tmp_path, "mode", mapped.replace("0755", "'0999'"))
+        with pytest.raises(ValueError, match=r"payload\[0\]\.mode"):
+            _load_spec(str(tmp_path / "pkgs" / "mode" / "config.yml"))
+
     def test_valid_plugin_spec_passes(self, tmp_path):
         write(tmp_path, "caddy", PLUGIN_SPEC)
         spec = _load_spec(str(tmp_path / "pkgs" / "caddy" / "config.yml"))
@@ -37,23 +37,14 @@ echo "::endgroup::"
 mkdir -p "${DIST_ROOT}/dist/pkg/usr/local"
 chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local"
 
-# Stage the plugin source tree (MVC, configd actions/templates, rc script, ...).
-cp -R "${SCRIPT_DIR}/src/." "${DIST_ROOT}/dist/pkg/usr/local/"
+# The plugin tree, rc.d script and our own license are packed in place from
+# the spec's payload mapping; only the build outputs are staged here.
 
 # Shared vendored editor assets -> /opnsense/www/js/vendor (served as /ui/js/vendor).
 # The Monaco tree ships in the shared monaco-editor package
 # (both plugins depend on it) — not copied into plugin payloads, so pkg
 # never sees duplicate file ownership. See docs/design/shared-editor-vendor.md.
 
-# The rc.d script is staged usr/local-prefixed in the plugin tree (everything
-# else in src is /usr/local-relative); relocate it to the payload's
-# usr/local/etc/rc.d and drop the double-prefixed copy.
-mkdir -p "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d"
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d"
-install -m 0755 "${SCRIPT_DIR}/src/usr/local/etc/rc.d/homer" \
-    "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d/homer"
-rm -rf "${DIST_ROOT}/dist/pkg/usr/local/usr/local"
-
 # Stage the built static dashboard under /usr/local/www/homer.
 mkdir -p "${DIST_ROOT}/dist/pkg/usr/local/www"
 chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/www"
@@ -65,13 +56,11 @@ chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/homer"
 cp "${HOMER_BUILD_SRC}/LICENSE" "${DIST_ROOT}/dist/pkg/usr/local/share/doc/homer/LICENSE"
 chmod 0644 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/homer/LICENSE"
 
-# Our own MIT license for the plugin code (distinct from Homer's Apache-2.0).
 # Per-license-ID files so pkg-tool can stage them into the package licenses
-# dir (Firmware -> Packages reads them from there).
+# dir (Firmware -> Packages reads them from there). Our own MIT
+# LICENSE.MIT comes from the payload mapping.
 mkdir -p "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer"
 chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer"
-cp "${SCRIPT_DIR}/LICENSE" "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer/LICENSE.MIT"
-chmod 0644 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer/LICENSE.MIT"
 cp "${HOMER_BUILD_SRC}/LICENSE" "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer/LICENSE.APACHE20"
 chmod 0644 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-homer/LICENSE.APACHE20"
 
@@ -83,10 +72,9 @@ ${SRC_REPO}/archive/refs/tags/v${HOMER_VERSION}.tar.gz
 EOF
 chmod 0644 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/homer/SOURCE"
 
-# Normalize permissions (the rc.d script must stay executable).
+# Normalize permissions of the staged build outputs.
 find "${DIST_ROOT}/dist/pkg/usr/local" -type d -exec chmod 0755 {} +
 find "${DIST_ROOT}/dist/pkg/usr/local" -type f -exec chmod 0644 {} +
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d/homer"
 
 # Create BSD distribution pkg
 cd "${DIST_ROOT}/dist"
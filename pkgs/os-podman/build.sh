@@ -12,34 +12,9 @@ DIST_ROOT="${GITHUB_WORKSPACE:-${REPO_ROOT}}"
 
 echo "Building os-${PKG_NAME} - ARCH: ${ARCH} - ABI: ${ABI}"
 
-# Create the payload staging root (FreeBSD default paths under dist/pkg).
-mkdir -p "${DIST_ROOT}/dist/pkg/usr/local"
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local"
-
-# Stage the plugin source tree (MVC, configd actions/templates, rc script, ...).
-cp -R "${SCRIPT_DIR}/src/." "${DIST_ROOT}/dist/pkg/usr/local/"
-
-# The rc.d script is staged usr/local-prefixed in the plugin tree (everything
-# else in src is /usr/local-relative); relocate it to the payload's
-# usr/local/etc/rc.d and drop the double-prefixed copy.
-mkdir -p "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d"
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d"
-install -m 0755 "${SCRIPT_DIR}/src/usr/local/etc/rc.d/podman-service" \
-    "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d/podman-service"
-rm -rf "${DIST_ROOT}/dist/pkg/usr/local/usr/local"
-
-# License file
-mkdir -p "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-podman"
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-podman"
-cp "${REPO_ROOT}/LICENSE" "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-podman/LICENSE"
-chmod 0644 "${DIST_ROOT}/dist/pkg/usr/local/share/doc/os-podman/LICENSE"
-
-# Normalize permissions
-find "${DIST_ROOT}/dist/pkg/usr/local" -type d -exec chmod 0755 {} +
-find "${DIST_ROOT}/dist/pkg/usr/local" -type f -exec chmod 0644 {} +
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/etc/rc.d/podman-service"
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/opnsense/scripts/OPNsense/Podman/"*.php 2>/dev/null || true
-chmod 0755 "${DIST_ROOT}/dist/pkg/usr/local/opnsense/scripts/OPNsense/Podman/"*.py 2>/dev/null || true
+# The plugin tree, rc.d script and license are packed in place from the
+# spec's payload mapping (modes included); nothing is staged under dist/pkg.
+mkdir -p "${DIST_ROOT}/dist"
 
 # Create BSD distribution pkg
 cd "${DIST_ROOT}/dist"